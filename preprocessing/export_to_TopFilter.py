@@ -1,6 +1,20 @@
 import pandas as pd
 import os.path
+
+# Packed corpus TopFilter prefers over the loose files when present
+PACKED_FILENAME = "corpus.tfpack"
+
+
 def export(dataset, directory):
+    """
+    Write the TopFilter dataset: projects.txt and one dicth_/graph_ file pair
+    per repository. A packed corpus left by an earlier export is removed, since
+    TopFilter would read it instead of the new files; pack the export with
+    topfilter/packed_corpus.py when wanted.
+    """
+    packed_file = os.path.join(directory, PACKED_FILENAME)
+    if os.path.exists(packed_file):
+        os.remove(packed_file)
 
     projects_list = []
     for index, row in dataset.iterrows():
@@ -18,4 +32,4 @@ def export(dataset, directory):
                 writer.write(f"1#{str(i)}\n")
     with open(os.path.join(directory,"projects.txt"), "w") as writer:
         for proj in projects_list:
-            writer.write(f"{proj}\n")
\ No newline at end of file
+            writer.write(f"{proj}\n")
@@ -1,17 +1,21 @@
 import logging
 from pathlib import Path
 from collections import defaultdict
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Set, Tuple, Optional
+import numpy as np
 from data_reader import DataReader
+from corpus_store import CorpusStore
+import hit_matrix
 
 class BayesianValidator:
     """
     Validator for Bayesian recommendation system that computes precision, recall, success rate, and coverage metrics.
     """
 
-    def __init__(self, src_dir: str):
+    def __init__(self, src_dir: str, store: Optional[CorpusStore] = None):
         self.src_dir = src_dir
         self.reader = DataReader(src_dir)
+        self.store = store or CorpusStore.for_dataset(src_dir)
         self.logger = logging.getLogger(__name__)
 
     def get_real_repo_topic(self) -> Dict[str, Set[str]]:
@@ -26,8 +30,7 @@ class BayesianValidator:
 
         for repo in multimap.keys():
             parsed_repo = repo.replace("/", "__")
-            file_path = Path(self.src_dir) / f"dicth_{parsed_repo}"
-            topics = self.reader.get_libraries(str(file_path))
+            topics = self.store.get_libraries(parsed_repo)
             if topics:
                 real_topics[repo].update(topics)
 
@@ -37,31 +40,25 @@ class BayesianValidator:
         """
         Compute precision, recall, and success rate metrics for top 20 recommendations.
         """
-        precision = {i: 0.0 for i in range(1, 21)}
-        recall = {i: 0.0 for i in range(1, 21)}
-        success_rate = {i: 0.0 for i in range(1, 21)}
-
         real = self.get_real_repo_topic()
         ease_result = self.reader.get_EASE_output()
 
-        for reponame, real_topics in real.items():
-            repo_result = list(ease_result.get(reponame, []))
-
-            for i in range(1, 21):
-                i_list = set(repo_result[:i])
-                intersection = i_list.intersection(real_topics)
-
-                precision[i] += len(intersection) / i
-                recall[i] += len(intersection) / len(real_topics) if real_topics else 0
-                success_rate[i] += 1 if intersection else 0
+        rankings = [list(ease_result.get(reponame, [])) for reponame in real]
+        cum_hits = hit_matrix.cumulative_hits(hit_matrix.hit_matrix(rankings, list(real.values()), 20))
+        num_relevant = np.array([len(real_topics) for real_topics in real.values()], dtype=np.int64)
+        precision = hit_matrix.column_sums(hit_matrix.precision(cum_hits))
+        recall = hit_matrix.column_sums(hit_matrix.recall(cum_hits, num_relevant))
+        success_rate = hit_matrix.column_sums(hit_matrix.success_rate(cum_hits).astype(np.float64))
 
         # Calculate averages
         num_repos = len(real)
         if num_repos > 0:
-            for i in range(1, 21):
-                precision[i] /= num_repos
-                recall[i] /= num_repos
-                success_rate[i] /= num_repos
+            precision /= num_repos
+            recall /= num_repos
+            success_rate /= num_repos
+        precision = dict(enumerate(precision.tolist(), 1))
+        recall = dict(enumerate(recall.tolist(), 1))
+        success_rate = dict(enumerate(success_rate.tolist(), 1))
 
         # Log results
         for i in range(1, 21):
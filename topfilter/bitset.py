@@ -0,0 +1,27 @@
+import numpy as np
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def pack_columns(matrix: np.ndarray) -> np.ndarray:
+    """
+    Encode every column of a boolean matrix as a bitset, giving a
+    (ceil(rows / 8), columns) uint8 array.
+    """
+    return np.packbits(np.asarray(matrix, dtype=bool), axis=0)
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """
+    Number of set bits of every packed column.
+    """
+    return _POPCOUNT[bits].sum(axis=0, dtype=np.int64)
+
+
+def co_occurrence(bits1: np.ndarray, bits2: np.ndarray) -> np.ndarray:
+    """
+    counts[a, b] = popcount(bits1[:, a] & bits2[:, b]), i.e. the number of rows
+    where column a of the first set and column b of the second are both set.
+    """
+    return _POPCOUNT[bits1[:, :, None] & bits2[:, None, :]].sum(axis=0, dtype=np.int64)
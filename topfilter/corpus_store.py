@@ -0,0 +1,196 @@
+import os
+import sys
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from graph import Graph
+from packed_corpus import PackedCorpus
+
+
+class ProjectRecord:
+    """
+    Parsed content of a project's dicth_/graph_ pair.
+    """
+    __slots__ = ("libraries", "library_ids", "dictionary", "out_links", "size")
+
+    def __init__(self, libraries: Set[str], library_ids: FrozenSet[int],
+                 dictionary: Dict[int, str], out_links: Dict[int, Set[int]]):
+        self.libraries = libraries
+        self.library_ids = library_ids
+        self.dictionary = dictionary
+        self.out_links = out_links
+        self.size = self._estimate_size()
+
+    def _estimate_size(self) -> int:
+        size = sys.getsizeof(self.libraries) + sys.getsizeof(self.library_ids)
+        size += sys.getsizeof(self.dictionary) + sys.getsizeof(self.out_links)
+        size += sum(sys.getsizeof(lib) for lib in self.libraries)
+        size += sum(sys.getsizeof(links) for links in self.out_links.values())
+        return size
+
+
+class CorpusStore:
+    """
+    Dataset-level store of the dicth_/graph_ corpus, read from the packed
+    corpus file when the dataset has one. Every project is parsed once
+    and kept in memory; when the estimated size of the parsed records exceeds
+    the memory budget the least recently used projects are evicted.
+    """
+    DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+    _stores: Dict[str, 'CorpusStore'] = {}
+
+    def __init__(self, src_dir: str, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.src_dir = src_dir
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.records: 'OrderedDict[str, ProjectRecord]' = OrderedDict()
+        self.vocabulary: Dict[str, int] = {}
+        self.libraries_by_id: List[str] = []
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def for_dataset(cls, src_dir: str, memory_budget: Optional[int] = None) -> 'CorpusStore':
+        """
+        Return the store shared by every component working on the given dataset.
+        """
+        key = os.path.abspath(src_dir)
+        store = cls._stores.get(key)
+        if store is None:
+            store = cls(src_dir, memory_budget or cls.DEFAULT_MEMORY_BUDGET)
+            cls._stores[key] = store
+        elif memory_budget is not None:
+            store.set_memory_budget(memory_budget)
+        return store
+
+    def set_memory_budget(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self._evict()
+
+    def preload(self, projects: Iterable[str]):
+        for project in projects:
+            self.get(project)
+
+    def get(self, project: str) -> ProjectRecord:
+        record = self.records.get(project)
+        if record is not None:
+            self.hits += 1
+            self.records.move_to_end(project)
+            return record
+
+        self.misses += 1
+        record = self._load(project)
+        self.records[project] = record
+        self.memory_used += record.size
+        self._evict()
+        return record
+
+    def _evict(self):
+        while self.memory_used > self.memory_budget and len(self.records) > 1:
+            _, record = self.records.popitem(last=False)
+            self.memory_used -= record.size
+
+    def _library_id(self, library: str) -> int:
+        lib_id = self.vocabulary.get(library)
+        if lib_id is None:
+            lib_id = len(self.libraries_by_id)
+            self.vocabulary[library] = lib_id
+            self.libraries_by_id.append(library)
+        return lib_id
+
+    def _load(self, project: str) -> ProjectRecord:
+        packed = PackedCorpus.for_directory(self.src_dir)
+        if packed is not None and project in packed:
+            return self._make_record(packed.get_dictionary_lines(project), packed.get_out_links(project))
+
+        dict_file = os.path.join(self.src_dir, f"dicth_{project}")
+        graph_file = os.path.join(self.src_dir, f"graph_{project}")
+        lines = []
+        out_links = defaultdict(set)
+
+        try:
+            with open(dict_file, 'r') as reader:
+                for line in reader:
+                    vals = line.split("\t")
+                    lines.append((int(vals[0].strip()), vals[1].strip()))
+        except IOError as e:
+            self.logger.error(f"Error reading file {dict_file}: {e}")
+
+        try:
+            with open(graph_file, 'r') as reader:
+                for line in reader:
+                    pair = line.strip().split("#")
+                    start_node = int(pair[0].strip())
+                    end_node = int(pair[1].strip())
+                    out_links[start_node].add(end_node)
+        except IOError as e:
+            self.logger.error(f"Error initializing graph from {graph_file}: {e}")
+
+        return self._make_record(lines, dict(out_links))
+
+    def source_stat(self, project: str) -> Optional[os.stat_result]:
+        """
+        Stat of the file the project is read from: the packed corpus when it
+        has the project, its dicth_ file otherwise; None when neither exists.
+        """
+        packed = PackedCorpus.for_directory(self.src_dir)
+        filename = os.path.join(self.src_dir, f"dicth_{project}")
+        if packed is not None and project in packed:
+            filename = packed.filename
+        try:
+            return os.stat(filename)
+        except OSError:
+            return None
+
+    def _make_record(self, lines: List[Tuple[int, str]], out_links: Dict[int, Set[int]]) -> ProjectRecord:
+        libraries = set()
+        dictionary = {}
+        for ID, artifact in lines:
+            if "#DEP#" in artifact:
+                libraries.add(artifact)
+                dictionary[ID] = artifact
+            elif ID == 1:
+                dictionary[ID] = artifact
+
+        library_ids = frozenset(self._library_id(lib) for lib in libraries)
+        return ProjectRecord(libraries, library_ids, dictionary, out_links)
+
+    def get_libraries(self, project: str) -> Set[str]:
+        return set(self.get(project).libraries)
+
+    def get_library_ids(self, project: str) -> FrozenSet[int]:
+        return self.get(project).library_ids
+
+    def get_library(self, lib_id: int) -> str:
+        return self.libraries_by_id[lib_id]
+
+    def get_library_id(self, library: str) -> int:
+        """
+        Vocabulary id of a library, registering libraries not seen so far.
+        """
+        return self._library_id(library)
+
+    def read_dictionary(self, project: str) -> Dict[int, str]:
+        return dict(self.get(project).dictionary)
+
+    def get_graph(self, project: str, dictionary: Optional[Dict[int, str]] = None) -> Graph:
+        """
+        Build the project's Graph keeping only the edges between nodes of the
+        given dictionary (the project's own dictionary by default).
+        """
+        record = self.get(project)
+        key_set = (dictionary if dictionary is not None else record.dictionary).keys()
+        graph = Graph()
+        nodes = set()
+        for start_node, outlinks in record.out_links.items():
+            if start_node not in key_set:
+                continue
+            for end_node in outlinks:
+                if end_node in key_set:
+                    nodes.add(start_node)
+                    nodes.add(end_node)
+                    graph.OutLinks[start_node].add(end_node)
+        graph.nodeCount = len(nodes)
+        return graph
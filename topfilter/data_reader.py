@@ -1,4 +1,5 @@
 import os
+import sys
 import math
 import logging
 from pathlib import Path
@@ -6,22 +7,123 @@ from collections import defaultdict, OrderedDict
 from typing import Dict, List, Set, Tuple, Optional, Any, Union
 import heapq
 import csv
+import copy
+import functools
+from project_list_index import ProjectListIndex
+from packed_corpus import PackedCorpus
+
+
+def _ground_truth_file(filename: str, ground_truth_path: str) -> str:
+    return os.path.join(ground_truth_path, os.path.basename(filename).replace("dicth_", ""))
+
+
+def _estimate_size(value: Any) -> int:
+    """
+    Rough memory footprint of a parsed file: its containers and everything in them.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(key) + _estimate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_estimate_size(item) for item in value)
+    return size
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, tuple):
+        return tuple(copy.copy(v) for v in value)
+    return copy.copy(value)
+
+
+def cached_read():
+    """
+    Memoize a DataReader parser in the shared LRU cache, keyed by the parser,
+    the file path and the remaining arguments. An entry is reused while the
+    file actually parsed (see DataReader._source_stat) keeps the same mtime
+    and size. Callers get a shallow copy of the cached result so they can
+    modify it freely.
+
+    Only for the corpus inputs, which are not rewritten during a run: a
+    same-size rewrite within the mtime granularity would go unnoticed, so the
+    Similarities/, Recommendations/ and GroundTruth/ readers are not cached.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, filename: str, *args):
+            stat = self._source_stat(filename)
+            if stat is None:
+                return method(self, filename, *args)
+
+            cache = DataReader._cache
+            key = (method.__name__, os.path.abspath(filename)) + args
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            entry = cache.get(key)
+            if entry is not None and entry[0] == stamp:
+                DataReader.cache_hits += 1
+                cache.move_to_end(key)
+                return _copy(entry[1])
+
+            DataReader.cache_misses += 1
+            value = method(self, filename, *args)
+            DataReader._evict(key)
+            size = _estimate_size(value)
+            if size <= DataReader.cache_memory_budget:
+                cache[key] = (stamp, value, size)
+                DataReader.cache_memory_used += size
+                DataReader._shrink(DataReader.cache_memory_budget)
+            return _copy(value)
+        return wrapper
+    return decorator
+
 
 class DataReader:
+    # Parsed files shared by every reader, in least recently used order, with their estimated size
+    _cache: 'OrderedDict[Tuple, Tuple[Tuple[int, int], Any, int]]' = OrderedDict()
+    cache_memory_budget = 256 * 1024 * 1024
+    cache_memory_used = 0
+    cache_hits = 0
+    cache_misses = 0
+
     def __init__(self, src_dir: str):
         self.src_dir = src_dir
         self.eASEOutput = defaultdict(list)
         self.logger = logging.getLogger(__name__)
 
+    @classmethod
+    def set_cache_memory_budget(cls, memory_budget: int):
+        cls.cache_memory_budget = memory_budget
+        cls._shrink(memory_budget)
+
+    @classmethod
+    def _evict(cls, key: Tuple):
+        entry = cls._cache.pop(key, None)
+        if entry is not None:
+            cls.cache_memory_used -= entry[2]
+
+    @classmethod
+    def _shrink(cls, memory_budget: int):
+        while cls._cache and cls.cache_memory_used > memory_budget:
+            _, (_, _, size) = cls._cache.popitem(last=False)
+            cls.cache_memory_used -= size
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+        cls.cache_memory_used = 0
+        cls.cache_hits = 0
+        cls.cache_misses = 0
+
+    @classmethod
+    def cache_info(cls) -> Dict[str, int]:
+        return {"hits": cls.cache_hits, "misses": cls.cache_misses, "size": len(cls._cache),
+                "memory_used": cls.cache_memory_used, "memory_budget": cls.cache_memory_budget}
+
     def get_number_of_projects(self, filename: str) -> int:
-        count = 0
         try:
-            with open(filename, 'r') as f:
-                for _ in f:
-                    count += 1
+            return ProjectListIndex.for_file(filename).num_lines()
         except IOError as e:
             self.logger.error(f"Error reading file {filename}: {e}")
-        return count
+        return 0
 
     def read_repository_list(self, filename: str) -> Dict[int, str]:
         ret = {}
@@ -38,82 +140,123 @@ class DataReader:
         return ret
 
     def read_project_list(self, filename: str, start_pos: int, end_pos: int) -> Dict[int, str]:
+        """
+        Projects of lines max(start_pos, 1)..end_pos, numbered from start_pos.
+        """
         ret = {}
-        count = 1
-        id = start_pos
         try:
-            with open(filename, 'r') as reader:
-                while count < start_pos:
-                    reader.readline()
-                    count += 1
-                
-                while True:
-                    line = reader.readline()
-                    if not line or count > end_pos:
-                        break
-                    line = line.strip()
-                    repo = line.split(",")[0].strip()
-                    ret[id] = repo
-                    id += 1
-                    count += 1
+            names = ProjectListIndex.for_file(filename).get_names(start_pos, end_pos)
+            ret = dict(zip(range(start_pos, start_pos + len(names)), names))
         except IOError as e:
             self.logger.error(f"Error reading file {filename}: {e}")
         return ret
 
+    def _packed_project(self, filename: str) -> Tuple[Optional[PackedCorpus], str]:
+        packed = PackedCorpus.for_directory(os.path.dirname(filename) or ".")
+        project = os.path.basename(filename).replace("dicth_", "", 1)
+        if packed is not None and project in packed:
+            return packed, project
+        return None, project
+
+    def _source_stat(self, filename: str) -> Optional[os.stat_result]:
+        """
+        Stat of the file a read of filename parses: the packed corpus when it
+        has the project, filename itself otherwise; None when neither exists.
+        """
+        if os.path.basename(filename).startswith("dicth_"):
+            packed, _ = self._packed_project(filename)
+            if packed is not None:
+                filename = packed.filename
+        try:
+            return os.stat(filename)
+        except OSError:
+            return None
+
+    def read_dictionary_lines(self, filename: str) -> List[Tuple[int, str]]:
+        """
+        (id, artifact) lines of a dicth_ file, read from the dataset's packed corpus
+        when it has the project and from the loose file otherwise.
+        """
+        packed, project = self._packed_project(filename)
+        if packed is not None:
+            return packed.get_dictionary_lines(project)
+
+        lines = []
+        with open(filename, 'r') as reader:
+            for line in reader:
+                vals = line.split("\t")
+                lines.append((int(vals[0].strip()), vals[1].strip()))
+        return lines
+
+    def has_dictionary(self, filename: str) -> bool:
+        return self._packed_project(filename)[0] is not None or os.path.exists(filename)
+
+    @cached_read()
     def read_dictionary(self, filename: str) -> Dict[int, str]:
         vector = {}
         try:
-            with open(filename, 'r') as reader:
-                for line in reader:
-                    vals = line.split("\t")
-                    ID = int(vals[0].strip())
-                    artifact = vals[1].strip()
-                    if ID == 1 or "#DEP#" in artifact:
-                        vector[ID] = artifact
+            for ID, artifact in self.read_dictionary_lines(filename):
+                if ID == 1 or "#DEP#" in artifact:
+                    vector[ID] = artifact
         except IOError as e:
             self.logger.error(f"Error reading file {filename}: {e}")
         return vector
 
-    def extract_half_dictionary(self, filename: str, ground_truth_path: str, get_also_users: bool) -> Dict[int, str]:
+    @cached_read()
+    def split_half_dictionary(self, filename: str, get_also_users: bool) -> Tuple[Dict[int, str], List[Tuple[int, str]]]:
+        """
+        Split a project's dictionary into the query (first half of its #DEP# topics,
+        plus its other artifacts) and the ground truth (the remaining topics).
+        """
         dictionary = {}
         ret = {}
+        ground_truth = []
         lib_count = 0
         
-        fname = os.path.basename(filename).replace("dicth_", "")
-        ground_truth_file = os.path.join(ground_truth_path, fname)
-        
         try:
-            with open(filename, 'r') as reader, open(ground_truth_file, 'w') as writer:
-                for line in reader:
-                    vals = line.split("\t")
-                    ID = int(vals[0].strip())
-                    artifact = vals[1].strip()
-                    dictionary[ID] = artifact
-                    if "#DEP#" in artifact:
-                        lib_count += 1
-                
-                half = round(lib_count / 2)
-                enough_lib = False
-                lib_count = 0
-                
-                for key, artifact in dictionary.items():
-                    if lib_count == half:
-                        enough_lib = True
-                    
-                    if "#DEP#" in artifact:
-                        if not enough_lib:
-                            ret[key] = artifact
-                        else:
-                            content = f"{key}\t{artifact}"
-                            writer.write(content + "\n")
-                            writer.flush()
-                        lib_count += 1
-                    else:
-                        if get_also_users or "#DEP#" not in artifact:
-                            ret[key] = artifact
+            for ID, artifact in self.read_dictionary_lines(filename):
+                dictionary[ID] = artifact
+                if "#DEP#" in artifact:
+                    lib_count += 1
         except IOError as e:
             self.logger.error(f"Error processing dictionary {filename}: {e}")
+            return ret, ground_truth
+        
+        half = round(lib_count / 2)
+        enough_lib = False
+        lib_count = 0
+        
+        for key, artifact in dictionary.items():
+            if lib_count == half:
+                enough_lib = True
+            
+            if "#DEP#" in artifact:
+                if not enough_lib:
+                    ret[key] = artifact
+                else:
+                    ground_truth.append((key, artifact))
+                lib_count += 1
+            else:
+                if get_also_users or "#DEP#" not in artifact:
+                    ret[key] = artifact
         
+        return ret, ground_truth
+
+    def write_ground_truth(self, filename: str, ground_truth_path: str, ground_truth: List[Tuple[int, str]]):
+        """
+        Write the ground truth of the project of dictionary file filename in one buffered write.
+        """
+        ground_truth_file = _ground_truth_file(filename, ground_truth_path)
+        try:
+            with open(ground_truth_file, 'w') as writer:
+                writer.write("".join(f"{key}\t{artifact}\n" for key, artifact in ground_truth))
+        except IOError as e:
+            self.logger.error(f"Error writing ground truth {ground_truth_file}: {e}")
+
+    def extract_half_dictionary(self, filename: str, ground_truth_path: str, get_also_users: bool) -> Dict[int, str]:
+        ret, ground_truth = self.split_half_dictionary(filename, get_also_users)
+        if self.has_dictionary(filename):
+            self.write_ground_truth(filename, ground_truth_path, ground_truth)
         return ret
 
     def load_EASE_output(self):
@@ -138,7 +281,10 @@ class DataReader:
             self.load_EASE_output()
         return self.eASEOutput
 
-    def extract_EASE_dictionary(self, filename: str, number_of_topics: int, ground_truth_path: str) -> Dict[int, str]:
+    def split_EASE_dictionary(self, filename: str, number_of_topics: int) -> Tuple[Dict[int, str], List[Tuple[int, str]]]:
+        """
+        Query made of the project's first EASE topics; every #DEP# topic of its dictionary is ground truth.
+        """
         if not self.eASEOutput:
             self.load_EASE_output()
             
@@ -151,38 +297,33 @@ class DataReader:
         for topic in topics:
             ret[i] = topic.strip()
             i += 1
-            
-        fname = os.path.basename(filename).replace("dicth_", "")
-        ground_truth_file = os.path.join(ground_truth_path, fname)
         
+        return ret, self.read_EASE_ground_truth(filename)
+
+    @cached_read()
+    def read_EASE_ground_truth(self, filename: str) -> List[Tuple[int, str]]:
+        dictionary = {}
         try:
-            with open(filename, 'r') as reader, open(ground_truth_file, 'w') as writer:
-                dictionary = {}
-                for line in reader:
-                    vals = line.split("\t")
-                    ID = int(vals[0].strip())
-                    artifact = vals[1].strip()
-                    if artifact.startswith("#DEP#"):
-                        dictionary[ID] = artifact
-                
-                for key, artifact in dictionary.items():
-                    content = f"{key}\t{artifact}"
-                    writer.write(content + "\n")
-                    writer.flush()
+            for ID, artifact in self.read_dictionary_lines(filename):
+                if artifact.startswith("#DEP#"):
+                    dictionary[ID] = artifact
         except IOError as e:
             self.logger.error(f"Error processing EASE dictionary {filename}: {e}")
-        
+        return list(dictionary.items())
+
+    def extract_EASE_dictionary(self, filename: str, number_of_topics: int, ground_truth_path: str) -> Dict[int, str]:
+        ret, ground_truth = self.split_EASE_dictionary(filename, number_of_topics)
+        if self.has_dictionary(filename):
+            self.write_ground_truth(filename, ground_truth_path, ground_truth)
         return ret
 
+    @cached_read()
     def get_libraries(self, filename: str) -> Set[str]:
         libraries = set()
         try:
-            with open(filename, 'r') as reader:
-                for line in reader:
-                    vals = line.split("\t")
-                    library = vals[1].strip()
-                    if "#DEP#" in library:
-                        libraries.add(library)
+            for _, library in self.read_dictionary_lines(filename):
+                if "#DEP#" in library:
+                    libraries.add(library)
         except IOError as e:
             self.logger.error(f"Error reading libraries from {filename}: {e}")
         return libraries
@@ -251,6 +392,7 @@ class DataReader:
             self.logger.error(f"Error reading all recommendations from {filename}: {e}")
         return ret
 
+    @cached_read()
     def read_long_tail_items(self, filename: str) -> Set[str]:
         ret = set()
         try:
@@ -292,6 +434,20 @@ class DataReader:
             self.logger.error(f"Error reading recommendation scores from {filename}: {e}")
         return ret
 
+    def read_ranked_recommendations(self, filename: str) -> List[Tuple[str, float]]:
+        """
+        Every (library, score) line of a recommendation file, in rank order.
+        """
+        ret = []
+        try:
+            with open(filename, 'r') as reader:
+                for line in reader:
+                    vals = line.split("\t")
+                    ret.append((vals[0].strip(), float(vals[1].strip())))
+        except IOError as e:
+            self.logger.error(f"Error reading ranked recommendations from {filename}: {e}")
+        return ret
+
     def read_ground_truth_file(self, filename: str) -> Set[str]:
         ret = set()
         try:
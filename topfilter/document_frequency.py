@@ -0,0 +1,85 @@
+import os
+import math
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+from corpus_store import CorpusStore
+from graph import Graph
+
+
+class DocumentFrequency:
+    """
+    Number of projects linking to each #DEP# topic, keyed by topic name.
+    The table for the whole dataset is computed once; the table of a fold's
+    training set is obtained by subtracting the held-out projects, and the
+    IDF seen by a testing project is the training table plus that project's
+    own one-project delta.
+    """
+
+    _datasets: Dict[Tuple[str, frozenset], 'DocumentFrequency'] = {}
+
+    def __init__(self):
+        self.num_projects = 0
+        self.df: Dict[str, int] = defaultdict(int)
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def for_dataset(cls, store: CorpusStore, projects: Iterable[str]) -> 'DocumentFrequency':
+        """
+        Return the (cached) table over every given project of the dataset.
+        """
+        projects = frozenset(projects)
+        key = (os.path.abspath(store.src_dir), projects)
+        table = cls._datasets.get(key)
+        if table is None:
+            table = cls()
+            for project in projects:
+                table.add_project(store, project)
+            cls._datasets[key] = table
+        return table
+
+    @classmethod
+    def from_graph(cls, graph: Graph, dictionary: Dict[int, str]) -> 'DocumentFrequency':
+        table = cls()
+        table.add_graph(graph, dictionary)
+        return table
+
+    def add_graph(self, graph: Graph, dictionary: Dict[int, str], sign: int = 1):
+        """
+        Count every start node with out-links as a project and every linked node as one of its topics.
+        """
+        for start_node, outlinks in graph.get_out_links().items():
+            if not outlinks:
+                continue
+            self.num_projects += sign
+            for end_node in outlinks:
+                self.df[dictionary.get(end_node, "")] += sign
+
+    def add_project(self, store: CorpusStore, project: str, sign: int = 1):
+        dictionary = store.read_dictionary(project)
+        self.add_graph(store.get_graph(project, dictionary), dictionary, sign)
+
+    def subtract(self, store: CorpusStore, projects: Iterable[str]) -> 'DocumentFrequency':
+        """
+        Return a copy of the table without the given projects, e.g. the held-out fold.
+        """
+        table = DocumentFrequency()
+        table.num_projects = self.num_projects
+        table.df.update(self.df)
+        for project in projects:
+            table.add_project(store, project, -1)
+        return table
+
+    def idf(self, lib: str, delta: Optional['DocumentFrequency'] = None) -> float:
+        """
+        IDF of a topic over this table extended with an optional one-project delta.
+        Topics no project links to get a weight of 0.
+        """
+        num_projects = self.num_projects
+        freq = self.df.get(lib, 0)
+        if delta is not None:
+            num_projects += delta.num_projects
+            freq += delta.df.get(lib, 0)
+        if freq <= 0:
+            return 0.0
+        return math.log(num_projects / freq)
@@ -0,0 +1,244 @@
+import logging
+from pathlib import Path
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from metrics import Metrics
+import hit_matrix
+
+
+class EvaluationEngine:
+    """
+    Single-pass evaluation of a fold. Every testing project's ranking and
+    ground truth are loaded once and fed to all metric accumulators, which
+    give the Results/*_RoundN tables without staging per-project SuccesRate/,
+    PrecisionRecall/ files (project_files=True still writes them, only those
+    of project_folders when given). The Metrics methods writing these files
+    are wrappers over it.
+    """
+
+    KEYED_TABLES = {"PRC", "PRCB", "SR", "SRB", "SR_STAR", "Catalog"}
+
+    def __init__(self, metrics: Metrics, bayesian: bool = False, num_of_EASE_input: int = 5,
+                 project_files: bool = False, project_folders: Optional[Set[str]] = None):
+        self.metrics = metrics
+        self.bayesian = bayesian
+        self.num_of_EASE_input = num_of_EASE_input
+        self.project_files = project_files
+        self.project_folders = project_folders
+        self.num_libs = metrics.num_libs
+        self.logger = logging.getLogger(__name__)
+
+    def run(self, cut_off_value: int) -> Tuple[Dict[str, float], float]:
+        """
+        Evaluate the fold and write its Results files; return the EPC and entropy
+        scores at cut_off_value, keyed by their Results file, and the recall rate.
+        """
+        tables, vals, recall_rate = self.evaluate(cut_off_value)
+        self.write_tables(self.metrics.res_dir, self.metrics.fold, tables)
+        return vals, recall_rate
+
+    def evaluate(self, cut_off_value: int) -> Tuple[Dict[str, List[List[Any]]], Dict[str, float], float]:
+        """
+        Evaluate the fold without writing Results: return the rows of every
+        result table (see result_file), the scores of run and the recall rate.
+        The rows of the KEYED_TABLES start with their cut-off.
+        """
+        self.tables: Dict[str, List[List[Any]]] = {}
+        m = self.metrics
+        num_libs = self.num_libs
+        limit = max(num_libs, 1)
+        limit_b = max(num_libs - self.num_of_EASE_input, 1)
+
+        filenames: List[str] = []
+        rankings: List[List[str]] = []
+        ground_truths: List[Set[str]] = []
+        rankings_b: List[List[str]] = []
+        ranks_b: List[List[int]] = []
+        libraries_b: List[Set[str]] = []
+        catalog = defaultdict(set)
+        misses = 0
+        top_50: Dict[str, Dict[int, str]] = {}
+        rec: Dict[str, Dict[int, str]] = {}
+        rec_by_key: Dict[int, Dict[int, str]] = {}
+        gt: Dict[str, Set[str]] = {}
+
+        for key_testing, testing_pro in m.testing_projects.items():
+            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+            ranking = m.read_ranked_recommendations(filename)
+            ground_truth = m.read_ground_truth_file(filename)
+
+            recommendations = {i: lib for i, (lib, _) in enumerate(ranking[:50], 1)}
+            top_50[filename] = recommendations
+            rec[filename] = {i: lib for i, lib in enumerate((lib for lib, score in ranking if score != 0), 1)}
+            rec_by_key[key_testing] = rec[filename]
+            gt[filename] = ground_truth
+            filenames.append(filename)
+            rankings.append(list(recommendations.values())[:limit])
+            ground_truths.append(ground_truth)
+
+            if not {lib for lib, _ in ranking[:num_libs]} & ground_truth:
+                misses += 1
+
+            catalog_ranking = ranking
+            if testing_pro != filename:
+                # Catalog coverage looks the recommendations up by the project name itself
+                catalog_ranking = m.read_ranked_recommendations(testing_pro)
+            for i in range(1, 11):
+                catalog[i].update(lib for lib, _ in catalog_ranking[:i])
+
+            if self.bayesian:
+                # The EASE topics come first, then the recommendations ranked after them
+                ease_topics = m.reader.get_EASE_topic(testing_pro, self.num_of_EASE_input)
+                ranked = list(recommendations)[:limit_b]
+                rankings_b.append(ease_topics + [recommendations[key] for key in ranked])
+                ranks_b.append(list(range(1, len(ease_topics) + 1)) + [key + self.num_of_EASE_input for key in ranked])
+                libraries_b.append(m.store.get_libraries(filename))
+
+        size = len(m.testing_projects)
+        recall_rate = (size - misses) / size
+        self.tables["Recall"] = [[recall_rate]]
+
+        lengths = hit_matrix.ranking_lengths(rankings, limit)
+        valid = hit_matrix.valid_ranks(lengths, limit)
+        num_relevant = np.array([len(ground_truth) for ground_truth in ground_truths], dtype=np.int64)
+        cum_hits = hit_matrix.cumulative_hits(hit_matrix.hit_matrix(rankings, ground_truths, limit))
+        precision = hit_matrix.precision(cum_hits)
+        recall = hit_matrix.recall(cum_hits, num_relevant)
+        depth = int(lengths.max(initial=0))
+        self.tables["PRC"] = self.precision_recall_rows(
+            hit_matrix.column_sums(np.where(valid, recall, 0.0))[:depth],
+            hit_matrix.column_sums(np.where(valid, precision, 0.0))[:depth], size)
+
+        # Projects with at least 1, 2, 3 and 4 hits at every cut-off
+        sr_star = [np.sum(hit_matrix.success_rate(cum_hits, level) & valid, axis=0).tolist() for level in range(1, 5)]
+        rows = []
+        for key in sorted(m.init_sr_map()):
+            counts = [counts[key - 1] if key <= limit else 0 for counts in sr_star]
+            rows.append([key] + [count / size if size != 0 else 0 for count in counts])
+        self.tables["SR_STAR"] = rows
+
+        success = np.where(valid, hit_matrix.success_rate(cum_hits), False).astype(np.float64)
+        success_rate: Optional[float] = None
+        for row, length in enumerate(lengths.tolist()):
+            if length:
+                success_rate = success[row, length - 1]
+            if success_rate is not None:
+                # Short rankings count as their last success rate up to num_libs
+                success[row, length:num_libs] = success_rate
+        sr = hit_matrix.column_sums(success)[:max(depth, num_libs) if depth else 0]
+        self.tables["SR"] = [[key, value / size if size != 0 else 0] for key, value in enumerate(sr.tolist(), 1)]
+
+        if self.project_files:
+            f_scores = hit_matrix.f_score(precision, recall)
+            for row, filename in enumerate(filenames):
+                length = int(lengths[row])
+                sizes = cum_hits[row, :length].tolist()
+                total_of_relevant = int(num_relevant[row])
+                self.write_project_files(filename, {
+                    m.success_rate_dir: [f"{i}\t{'1' if hits else '0'}" for i, hits in enumerate(sizes, 1)],
+                    m.success_rate_dir_n: [f"{i}\t{hits}" for i, hits in enumerate(sizes, 1)],
+                    m.pr_dir: [f"{i}\t{hits / total_of_relevant if total_of_relevant != 0 else 0}\t{hits / i}"
+                               for i, hits in enumerate(sizes, 1)],
+                    m.fs_dir: [f"{i}\t{value}" for i, value in enumerate(f_scores[row, :length].tolist(), 1)],
+                })
+
+        if self.bayesian:
+            self.evaluate_bayesian(filenames, rankings_b, ranks_b, libraries_b, size)
+
+        all_items = m.get_all_items()
+        self.tables["Catalog"] = [[i, len(items) / len(all_items)] for i, items in sorted(catalog.items())]
+        self.tables["Entropy"] = [[m.entropy(all_items, rec_by_key, i)] for i in range(1, num_libs + 1)]
+        self.tables["EPC"] = [[value] for value in m.epc_at_cut_offs(rec, m.popularity(top_50), gt)]
+        self.tables["nDCG"] = [[value] for value in m.ndcg_at_cut_offs(rec, gt)]
+
+        vals = {}
+        for name in ("EPC", "Entropy"):
+            # The value read back from the Results file by Metrics.get_some_scores
+            if len(self.tables[name]) >= cut_off_value:
+                vals[str(Path(m.res_dir) / self.result_file(name, m.fold))] = float(self.tables[name][cut_off_value - 1][0])
+        return self.tables, vals, recall_rate
+
+    def evaluate_bayesian(self, filenames: List[str], rankings: List[List[str]], ranks: List[List[int]],
+                          libraries: List[Set[str]], size: int):
+        """
+        Success rate and precision/recall of the EASE topics followed by the recommendations.
+        """
+        m = self.metrics
+        depth = max((len(ranking) for ranking in rankings), default=0)
+        lengths = hit_matrix.ranking_lengths(rankings, depth)
+        valid = hit_matrix.valid_ranks(lengths, depth)
+        divisors = np.ones((len(rankings), depth), dtype=np.int64)
+        for row, row_ranks in enumerate(ranks):
+            divisors[row, :len(row_ranks)] = row_ranks
+        num_relevant = np.array([len(topics) for topics in libraries], dtype=np.int64)
+        cum_hits = hit_matrix.cumulative_hits(hit_matrix.hit_matrix(rankings, libraries, depth))
+        precision = np.where(valid, hit_matrix.precision(cum_hits, divisors), 0.0)
+        recall = np.where(valid, hit_matrix.recall(cum_hits, num_relevant), 0.0)
+        success = np.where(valid, hit_matrix.success_rate(cum_hits), False).astype(np.float64)
+
+        cut_off = min(depth, self.num_libs)
+        sr = hit_matrix.column_sums(success[:, :cut_off])
+        self.tables["SRB"] = [[key, value / size if size != 0 else 0] for key, value in enumerate(sr.tolist(), 1)]
+        self.tables["PRCB"] = self.precision_recall_rows(hit_matrix.column_sums(recall[:, :cut_off]),
+                                                         hit_matrix.column_sums(precision[:, :cut_off]), size)
+
+        if self.project_files:
+            for row, filename in enumerate(filenames):
+                sizes = cum_hits[row, :int(lengths[row])].tolist()
+                total_of_relevant = int(num_relevant[row])
+                self.write_project_files(filename, {
+                    m.success_rate_dir_b: [f"{rank}\t{'1' if hits else '0'}" for rank, hits in zip(ranks[row], sizes)],
+                    m.pr_dir_b: [f"{rank}\t{hits / total_of_relevant if total_of_relevant != 0 else 0}\t{hits / rank}"
+                                 for rank, hits in zip(ranks[row], sizes)],
+                })
+
+    @staticmethod
+    def precision_recall_rows(recall_sums: np.ndarray, precision_sums: np.ndarray, size: int) -> List[List[Any]]:
+        rows = []
+        for key, (recall, precision) in enumerate(zip(recall_sums.tolist(), precision_sums.tolist()), 1):
+            recall = recall / size if size != 0 else 0
+            precision = precision / size if size != 0 else 0
+            rows.append([key, recall, precision])
+        return rows
+
+    @staticmethod
+    def result_file(name: str, fold: int) -> str:
+        """
+        Name of a fold's result table under Results/.
+        """
+        if name == "Catalog":
+            return f"Catalog{fold}"
+        return f"{name}_Round{fold}"
+
+    @staticmethod
+    def format_row(name: str, row: List[Any]) -> str:
+        if name == "SR_STAR":
+            return f"{row[0]}\t" + "\t".join(f"{value:.03f}" for value in row[1:])
+        return "\t".join(f"{value}" for value in row)
+
+    @classmethod
+    def write_tables(cls, res_dir: str, fold: int, tables: Dict[str, List[List[Any]]]):
+        for name, rows in tables.items():
+            output_file = str(Path(res_dir) / cls.result_file(name, fold))
+            try:
+                with open(output_file, 'w') as writer:
+                    writer.write("".join(f"{cls.format_row(name, row)}\n" for row in rows))
+            except IOError as e:
+                logging.getLogger(__name__).error(e)
+
+    def write_project_files(self, filename: str, contents: Dict[str, List[str]]):
+        """
+        Per-project success rate, precision/recall and F-score files, as read by get_f_scores
+        and get_precision_recall_scores.
+        """
+        for folder, lines in contents.items():
+            if self.project_folders is not None and folder not in self.project_folders:
+                continue
+            Path(folder).mkdir(exist_ok=True)
+            output_file = str(Path(folder) / filename)
+            try:
+                with open(output_file, 'w') as writer:
+                    writer.write("".join(f"{line}\n" for line in lines))
+            except IOError as e:
+                self.logger.error(e)
@@ -0,0 +1,100 @@
+import math
+from typing import Optional, Sequence, Set
+import numpy as np
+
+
+def hit_matrix(rankings: Sequence[Sequence[str]], ground_truths: Sequence[Set[str]], depth: int,
+               distinct: bool = True) -> np.ndarray:
+    """
+    Boolean (projects, depth) matrix: hits[p, r] is set when the item at rank
+    r + 1 of project p is in its ground truth. With distinct, an item ranked
+    again lower down is not counted twice. Short rankings are padded with misses.
+    """
+    hits = np.zeros((len(rankings), depth), dtype=bool)
+    for row, (ranking, ground_truth) in enumerate(zip(rankings, ground_truths)):
+        seen = set()
+        for rank, item in enumerate(ranking[:depth]):
+            if item in ground_truth and not (distinct and item in seen):
+                hits[row, rank] = True
+            seen.add(item)
+    return hits
+
+
+def ranking_lengths(rankings: Sequence[Sequence[str]], depth: int) -> np.ndarray:
+    return np.array([min(len(ranking), depth) for ranking in rankings], dtype=np.int64)
+
+
+def valid_ranks(lengths: np.ndarray, depth: int) -> np.ndarray:
+    """
+    mask[p, r] is set when project p has an item at rank r + 1.
+    """
+    return np.arange(depth) < lengths[:, None]
+
+
+def cumulative_hits(hits: np.ndarray) -> np.ndarray:
+    """
+    Number of hits among the first k items, for every cut-off k.
+    """
+    return np.cumsum(hits, axis=1, dtype=np.int64)
+
+
+def precision(cum_hits: np.ndarray, ranks: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Precision at every cut-off; ranks overrides the divisor of each column or cell.
+    """
+    if ranks is None:
+        ranks = np.arange(1, cum_hits.shape[1] + 1)
+    return cum_hits / ranks
+
+
+def recall(cum_hits: np.ndarray, num_relevant: np.ndarray) -> np.ndarray:
+    num_relevant = np.asarray(num_relevant)[:, None]
+    out = np.zeros(cum_hits.shape, dtype=np.float64)
+    return np.divide(cum_hits, num_relevant, out=out, where=num_relevant != 0)
+
+
+def success_rate(cum_hits: np.ndarray, level: int = 1) -> np.ndarray:
+    """
+    Whether at least level ground-truth items are among the first k, for every cut-off k.
+    """
+    return cum_hits >= level
+
+
+def f_score(precision_values: np.ndarray, recall_values: np.ndarray) -> np.ndarray:
+    val1 = 2 * recall_values * precision_values
+    val2 = recall_values + precision_values
+    out = np.zeros(val1.shape, dtype=np.float64)
+    return np.divide(val1, val2, out=out, where=(val1 != 0) & (val2 != 0))
+
+
+def discounts(depth: int) -> np.ndarray:
+    """
+    1 / log2(rank + 1) for the ranks 1..depth.
+    """
+    return np.array([1 / math.log2(rank + 1) for rank in range(1, depth + 1)])
+
+
+def ndcg(hits: np.ndarray, num_relevant: np.ndarray) -> np.ndarray:
+    """
+    nDCG of every project at every cut-off, from a non-distinct hit matrix
+    and the size of each ground truth.
+    """
+    depth = hits.shape[1]
+    gains = discounts(depth)
+    dcg = np.cumsum(np.where(hits, gains, 0.0), axis=1)
+    # Ideal DCG at cut-off n: every one of the first min(|ground truth|, n) ranks is a hit
+    ideal = np.concatenate(([0.0], np.cumsum(gains)))
+    idcg = ideal[np.minimum(np.asarray(num_relevant)[:, None], np.arange(1, depth + 1))]
+    out = np.zeros(dcg.shape, dtype=np.float64)
+    return np.divide(dcg, idcg, out=out, where=idcg != 0)
+
+
+def column_sums(values: np.ndarray) -> np.ndarray:
+    """
+    Sum of the rows, added one project after the other like a running
+    per-cut-off total, so results match the scalar accumulation bit for bit.
+    """
+    total = np.zeros(values.shape[1:], dtype=np.float64)
+    for row in values:
+        total += row
+    return total
@@ -0,0 +1,145 @@
+import os
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from scipy import sparse
+from corpus_store import CorpusStore
+from sparse_matrix import SparseMatrix
+
+
+class ItemSimilarityIndex:
+    """
+    Fold-scoped item-item index: for every #DEP# topic, its top-M most similar
+    topics over the training projects, by cosine of their co-occurrence
+    columns |a & b| / sqrt(|a| * |b|). Built once per fold and persisted in
+    the fold's ItemIndex folder, so scoring a testing project is a sparse
+    lookup-and-sum over its known topics. The saved index carries a stamp of
+    the fold's training projects, of projects.txt and of the corpus files
+    they are read from, and is rebuilt when any of them changes.
+    """
+
+    DEFAULT_TOP_M = 50
+    TOPICS_FILE = "topics.txt"
+    MATRIX_FILE = "similarities.npz"
+
+    def __init__(self, topics: List[str], matrix: SparseMatrix, top_m: int, stamp: str = ""):
+        self.topics = topics
+        self.columns = {topic: i for i, topic in enumerate(topics)}
+        # Row a holds the top-M neighbours of topic a
+        self.matrix = matrix
+        self.top_m = top_m
+        self.stamp = stamp
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def build(cls, store: CorpusStore, projects: Iterable[str], top_m: int = DEFAULT_TOP_M) -> 'ItemSimilarityIndex':
+        topics: List[str] = []
+        columns: Dict[str, int] = {}
+        rows, cols = [], []
+        num_projects = 0
+        for row, project in enumerate(projects):
+            num_projects += 1
+            for lib in store.get_libraries(project):
+                col = columns.get(lib)
+                if col is None:
+                    col = len(topics)
+                    columns[lib] = col
+                    topics.append(lib)
+                rows.append(row)
+                cols.append(col)
+
+        R = SparseMatrix.from_triplets(rows, cols, np.ones(len(rows)), (num_projects, len(topics)))
+        co = R.transpose().times_matrix(R).to_scipy().tocoo()
+        counts = co.diagonal()
+
+        off_diagonal = co.row != co.col
+        a, b, both = co.row[off_diagonal], co.col[off_diagonal], co.data[off_diagonal]
+        scores = both / np.sqrt(counts[a] * counts[b])
+
+        # Keep the top_m best neighbours of every topic, ties in topic order
+        order = np.lexsort((b, -scores, a))
+        a, b, scores = a[order], b[order], scores[order]
+        first = np.searchsorted(a, a, side="left")
+        keep = np.arange(len(a)) - first < top_m
+
+        matrix = sparse.csr_matrix((scores[keep], (a[keep], b[keep])), shape=(len(topics), len(topics)))
+        return cls(topics, SparseMatrix.from_scipy(matrix), top_m)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['ItemSimilarityIndex']:
+        try:
+            with open(os.path.join(path, cls.TOPICS_FILE), 'r') as reader:
+                top_m, _, stamp = reader.readline().rstrip("\n").partition("\t")
+                top_m = int(top_m)
+                topics = [line.rstrip("\n") for line in reader]
+            matrix = SparseMatrix.load(os.path.join(path, cls.MATRIX_FILE))
+        except (IOError, ValueError) as e:
+            logging.getLogger(__name__).error(f"Error loading item index from {path}: {e}")
+            return None
+        return cls(topics, matrix, top_m, stamp)
+
+    def save(self, path: str):
+        try:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, self.TOPICS_FILE), 'w') as writer:
+                writer.write(f"{self.top_m}\t{self.stamp}\n")
+                for topic in self.topics:
+                    writer.write(topic + "\n")
+            self.matrix.save(os.path.join(path, self.MATRIX_FILE))
+        except IOError as e:
+            self.logger.error(f"Error writing item index to {path}: {e}")
+
+    @staticmethod
+    def fold_stamp(projects: List[str], projects_file: Optional[str] = None,
+                   store: Optional[CorpusStore] = None) -> str:
+        """
+        Hash of the training projects, of the size and mtime of projects_file
+        and of those of the corpus file every project is read from by store.
+        """
+        digest = hashlib.sha1("\n".join(projects).encode("utf-8"))
+        stats = []
+        if projects_file is not None:
+            try:
+                stats.append(os.stat(projects_file))
+            except OSError:
+                pass
+        if store is not None:
+            stats.extend(store.source_stat(project) for project in projects)
+        for stat in stats:
+            if stat is not None:
+                digest.update(f"\t{stat.st_size}\t{stat.st_mtime_ns}".encode("utf-8"))
+            else:
+                digest.update(b"\t-")
+        return digest.hexdigest()
+
+    @classmethod
+    def for_fold(cls, store: CorpusStore, path: str, projects: Iterable[str],
+                 top_m: int = DEFAULT_TOP_M, projects_file: Optional[str] = None) -> 'ItemSimilarityIndex':
+        """
+        Load the index persisted at path, building and saving it when missing,
+        built with a different top_m or stamped for other training projects,
+        another projects_file or other corpus files.
+        """
+        projects = list(projects)
+        stamp = cls.fold_stamp(projects, projects_file, store)
+        index = None
+        if os.path.exists(os.path.join(path, cls.TOPICS_FILE)):
+            index = cls.load(path)
+        if index is None or index.top_m != top_m or index.stamp != stamp:
+            index = cls.build(store, projects, top_m)
+            index.stamp = stamp
+            index.save(path)
+        return index
+
+    def score(self, known: Iterable[str]) -> Dict[str, float]:
+        """
+        Score every topic linked to a known topic by the sum of its similarities
+        to the known topics; the known topics themselves are not scored.
+        """
+        known_ids = [self.columns[lib] for lib in known if lib in self.columns]
+        if not known_ids:
+            return {}
+        totals = self.matrix.to_scipy()[known_ids].sum(axis=0).A1
+        totals[known_ids] = 0.0
+        return {self.topics[i]: totals[i] for i in np.flatnonzero(totals).tolist()}
@@ -0,0 +1,42 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+
+class LibraryIndex:
+    """
+    Inverted index from a #DEP# topic to the training projects that use it.
+    Built once per fold so that a testing project is only compared with the
+    training projects sharing at least one topic with it.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self.project_libs: Dict[int, Set[str]] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, project_key: int, libraries: Iterable[str]):
+        libs = set(libraries)
+        self.project_libs[project_key] = libs
+        for lib in libs:
+            self.postings[lib].append(project_key)
+
+    def get_libraries(self, project_key: int) -> Set[str]:
+        return self.project_libs.get(project_key, set())
+
+    def all_libraries(self) -> Set[str]:
+        return set(self.postings.keys())
+
+    def candidates(self, libraries: Iterable[str]) -> Set[int]:
+        """
+        Return the keys of the training projects sharing at least one of the given topics.
+        """
+        ret = set()
+        for lib in libraries:
+            posting = self.postings.get(lib)
+            if posting:
+                ret.update(posting)
+        return ret
+
+    def num_projects(self) -> int:
+        return len(self.project_libs)
@@ -6,10 +6,14 @@ import io
 import os
 from pathlib import Path
 import logging
-from typing import Dict, List, Set, Tuple, Optional
+from typing import Any, Dict, List, Set, Sequence, Tuple, Optional
 import math
 from collections import defaultdict
 from data_reader import DataReader
+import numpy as np
+from corpus_store import CorpusStore
+import hit_matrix
+from pipeline import FoldData
 
 
 class Metrics:
@@ -17,7 +21,8 @@ class Metrics:
 
     def __init__(self, k: int, num_libs: int, src_dir: str, sub_folder: str, 
                  tr_start_pos1: int, tr_end_pos1: int, tr_start_pos2: int, 
-                 tr_end_pos2: int, te_start_pos: int, te_end_pos: int):
+                 tr_end_pos2: int, te_start_pos: int, te_end_pos: int,
+                 store: Optional[CorpusStore] = None, fold_data: Optional[FoldData] = None):
         self.logger = logging.getLogger(__name__)
 
         self.fold = k
@@ -34,6 +39,9 @@ class Metrics:
         self.res_dir = str(Path(self.src_dir) / "Results")
 
         self.reader = DataReader(self.src_dir)
+        self.store = store or CorpusStore.for_dataset(self.src_dir)
+        # Recommendations and ground truths of an in-memory pipeline run, read instead of the files
+        self.fold_data = fold_data
         self.training_start_pos1 = tr_start_pos1
         self.training_end_pos1 = tr_end_pos1
         self.training_start_pos2 = tr_start_pos2
@@ -45,6 +53,41 @@ class Metrics:
         self.testing_projects = self.reader.read_project_list(
             projects_file, self.testing_start_pos, self.testing_end_pos)
 
+    def read_recommendation_file(self, filename: str) -> Dict[int, str]:
+        if self.fold_data is not None:
+            return self.fold_data.read_recommendation_file(filename)
+        return self.reader.read_recommendation_file(str(Path(self.rec_dir) / filename))
+
+    def read_all_recommendations(self, filename: str) -> Dict[int, str]:
+        if self.fold_data is not None:
+            return self.fold_data.read_all_recommendations(filename)
+        return self.reader.read_all_recommendations(str(Path(self.rec_dir) / filename))
+
+    def read_recommendation_file_with_size(self, filename: str, size: int) -> Set[str]:
+        if self.fold_data is not None:
+            return self.fold_data.read_recommendation_file_with_size(filename, size)
+        return self.reader.read_recommendation_file_with_size(str(Path(self.rec_dir) / filename), size)
+
+    def read_recommendation_scores(self, filename: str) -> Dict[str, float]:
+        if self.fold_data is not None:
+            return self.fold_data.read_recommendation_scores(filename)
+        return self.reader.read_recommendation_scores(str(Path(self.rec_dir) / filename))
+
+    def read_ranked_recommendations(self, filename: str) -> List[Tuple[str, float]]:
+        if self.fold_data is not None:
+            return self.fold_data.read_ranked_recommendations(filename)
+        return self.reader.read_ranked_recommendations(str(Path(self.rec_dir) / filename))
+
+    def read_ground_truth_file(self, filename: str) -> Set[str]:
+        if self.fold_data is not None:
+            return self.fold_data.read_ground_truth_file(filename)
+        return self.reader.read_ground_truth_file(str(Path(self.ground_truth) / filename))
+
+    def read_ground_truth_score(self, filename: str) -> Dict[str, float]:
+        if self.fold_data is not None:
+            return self.fold_data.read_ground_truth_score(filename)
+        return self.reader.read_ground_truth_score(str(Path(self.ground_truth) / filename))
+
     def mean_absolute_error(self) -> None:
         key_testing_projects = self.testing_projects.keys()
         results = {}
@@ -53,11 +96,9 @@ class Metrics:
             testing_pro = self.testing_projects[key_testing]
             filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
 
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_recommendation_scores(rec_file)
+            recommendations = self.read_recommendation_scores(filename)
 
-            gt_file = str(Path(self.ground_truth) / filename)
-            ground_truth = self.reader.read_ground_truth_score(gt_file)
+            ground_truth = self.read_ground_truth_score(filename)
 
             key_set = ground_truth.keys()
             score = 0.0
@@ -80,496 +121,59 @@ class Metrics:
         except IOError as e:
             self.logger.error(e)
 
-    def recall_rate(self) -> float:
-        key_testing_projects = self.testing_projects.keys()
-        count = 0
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendation_file = self.reader.read_recommendation_file_with_size(rec_file, self.num_libs)
+    def evaluate(self, names: Sequence[str] = (), bayesian: bool = False,
+                 project_folders: Optional[Set[str]] = None,
+                 number_of_topics_from_ease: int = _NUM_OF_MNBN_TOPIC) -> Dict[str, List[List[Any]]]:
+        """
+        Evaluate the fold with the EvaluationEngine, which writes the per-project
+        files of the given folders; write the Results tables of the given names
+        and return all the tables.
+        """
+        # The engine is built on Metrics
+        from evaluation_engine import EvaluationEngine
+        engine = EvaluationEngine(self, bayesian, number_of_topics_from_ease, project_folders is not None,
+                                  project_folders)
+        tables = engine.evaluate(self.num_libs)[0]
+        EvaluationEngine.write_tables(self.res_dir, self.fold, {name: tables[name] for name in names})
+        return tables
 
-            gt_file = str(Path(self.ground_truth) / filename)
-            ground_truth_file = self.reader.read_ground_truth_file(gt_file)
-
-            common = set(recommendation_file) & set(ground_truth_file)
-            if not common:
-                count += 1
-
-        output_file = str(Path(self.res_dir) / f"Recall_Round{self.fold}")
-        total = len(key_testing_projects)
-        recall_rate = (total - count) / total
-
-        try:
-            with open(output_file, 'w') as writer:
-                writer.write(f"{recall_rate}\n")
-        except IOError as e:
-            self.logger.error(e)
-
-        return recall_rate
+    def recall_rate(self) -> float:
+        return self.evaluate(["Recall"])["Recall"][0][0]
 
     def success_rate(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            gt_data = str(Path(self.rec_dir) / filename)
-
-            recommendation_file = self.reader.read_recommendation_file(gt_data)
-            gt_data = str(Path(self.ground_truth) / filename)
-            ground_truth_file = self.reader.read_ground_truth_file(gt_data)
-
-            key_set = recommendation_file.keys()
-            temp = set()
-
-            success_rate_folder = Path(self.success_rate_dir)
-            success_rate_folder.mkdir(exist_ok=True)
-            success_rate_path = str(success_rate_folder / filename)
-
-            try:
-                with open(success_rate_path, 'w') as writer:
-                    count = 1
-                    for key in key_set:
-                        temp.add(recommendation_file[key])
-                        common = temp & set(ground_truth_file)
-                        size = len(common)
-                        content = f"{key}\t{'1' if size else '0'}"
-                        writer.write(f"{content}\n")
-
-                        count += 1
-                        if count > self.num_libs:
-                            break
-            except IOError as e:
-                self.logger.error(e)
+        self.evaluate(project_folders={self.success_rate_dir})
 
     def success_rate_b(self, number_of_topics_from_ease: int) -> None:
-        key_testing_projects = self.testing_projects.keys()
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-
-            ease_topics = self.reader.get_EASE_topic(testing_pro, number_of_topics_from_ease)
-            recommendation_data = self.reader.read_recommendation_file(rec_file)
-
-            gt_file = str(Path(self.ground_truth) / filename)
-            ground_truth_data = self.reader.read_ground_truth_file(gt_file)
-
-            training_dict_filename = str(Path(self.src_dir) / f"dicth_{filename}")
-            ground_truth_data = self.reader.get_libraries(training_dict_filename)
-
-            key_set = recommendation_data.keys()
-            temp = set(ease_topics)
-
-            success_rate_folder = Path(self.success_rate_dir_b)
-            success_rate_folder.mkdir(exist_ok=True)
-            success_rate_path = str(success_rate_folder / filename)
-
-            try:
-                with open(success_rate_path, 'w') as writer:
-                    i = 1
-                    temp_set = set()
-                    for element in ease_topics:
-                        temp_set.add(element)
-                        common = temp_set & set(ground_truth_data)
-                        size = len(common)
-                        content = f"{i}\t{'1' if size else '0'}"
-                        writer.write(f"{content}\n")
-                        i += 1
-
-                    count = 1
-                    for key in key_set:
-                        temp.add(recommendation_data[key])
-                        common = temp & set(ground_truth_data)
-                        size = len(common)
-                        content = f"{key + number_of_topics_from_ease}\t{'1' if size else '0'}"
-                        writer.write(f"{content}\n")
-
-                        count += 1
-                        if count > self.num_libs - number_of_topics_from_ease:
-                            break
-            except IOError as e:
-                self.logger.error(e)
+        self.evaluate(bayesian=True, project_folders={self.success_rate_dir_b},
+                      number_of_topics_from_ease=number_of_topics_from_ease)
 
     def success_rate_n(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            gt_data = str(Path(self.rec_dir) / filename)
-
-            recommendation_file = self.reader.read_recommendation_file(gt_data)
-            gt_data = str(Path(self.ground_truth) / filename)
-            ground_truth_file = self.reader.read_ground_truth_file(gt_data)
-
-            key_set = recommendation_file.keys()
-            temp = set()
-
-            success_rate_folder = Path(self.success_rate_dir_n)
-            success_rate_folder.mkdir(exist_ok=True)
-            success_rate_path = str(success_rate_folder / filename)
-
-            try:
-                with open(success_rate_path, 'w') as writer:
-                    count = 1
-                    for key in key_set:
-                        temp.add(recommendation_file[key])
-                        common = temp & set(ground_truth_file)
-                        size = len(common)
-                        content = f"{key}\t{size}"
-                        writer.write(f"{content}\n")
-
-                        count += 1
-                        if count > self.num_libs:
-                            break
-            except IOError as e:
-                self.logger.error(e)
+        self.evaluate(project_folders={self.success_rate_dir_n})
 
     def precision_recall(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendation_file = self.reader.read_recommendation_file(rec_file)
-
-            gt_file = str(Path(self.ground_truth) / filename)
-            ground_truth_file = self.reader.read_ground_truth_file(gt_file)
-
-            total_of_relevant = len(ground_truth_file)
-            key_set = recommendation_file.keys()
-            temp = set()
-
-            output_file = str(Path(self.pr_dir) / filename)
-            try:
-                with open(output_file, 'w') as writer:
-                    count = 1
-                    for key in key_set:
-                        temp.add(recommendation_file[key])
-                        common = temp & set(ground_truth_file)
-                        size = len(common)
-
-                        precision = size / key if key != 0 else 0
-                        recall = size / total_of_relevant if total_of_relevant != 0 else 0
-
-                        val1 = 2 * recall * precision
-                        val2 = recall + precision
-                        f_score = val1 / val2 if val1 and val2 else 0
-
-                        content = f"{key}\t{recall}\t{precision}"
-                        writer.write(f"{content}\n")
-
-                        count += 1
-                        if count > self.num_libs:
-                            break
-            except IOError as e:
-                self.logger.error(e)
+        self.evaluate(project_folders={self.pr_dir})
 
     def precision_recall_b(self, number_of_topics_from_ease: int) -> None:
-        key_testing_projects = self.testing_projects.keys()
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendation_file = self.reader.read_recommendation_file(rec_file)
-
-            gt_file = str(Path(self.ground_truth) / filename)
-            ground_truth_data = self.reader.read_ground_truth_file(gt_file)
-
-            training_dict_filename = str(Path(self.src_dir) / f"dicth_{filename}")
-            ground_truth_data = self.reader.get_libraries(training_dict_filename)
+        self.evaluate(bayesian=True, project_folders={self.pr_dir_b},
+                      number_of_topics_from_ease=number_of_topics_from_ease)
 
-            total_of_relevant = len(ground_truth_data)
-            ease_topics = self.reader.get_EASE_topic(testing_pro, number_of_topics_from_ease)
-            key_set = recommendation_file.keys()
-            temp = set(ease_topics)
-
-            output_file = str(Path(self.pr_dir_b) / filename)
-            Path(self.pr_dir_b).mkdir(exist_ok=True)
-
-            try:
-                with open(output_file, 'w') as writer:
-                    i = 1
-                    temp_set = set()
-                    for element in ease_topics:
-                        temp_set.add(element)
-                        common = temp_set & set(ground_truth_data)
-                        size = len(common)
-
-                        precision = size / i if i != 0 else 0
-                        recall = size / total_of_relevant if total_of_relevant != 0 else 0
-
-                        content = f"{i}\t{recall}\t{precision}"
-                        writer.write(f"{content}\n")
-                        i += 1
-
-                    count = 1
-                    for key in key_set:
-                        temp.add(recommendation_file[key])
-                        common = temp & set(ground_truth_data)
-                        size = len(common)
-
-                        precision = size / (key + number_of_topics_from_ease) if key != 0 else 0
-                        recall = size / total_of_relevant if total_of_relevant != 0 else 0
-
-                        content = f"{key + number_of_topics_from_ease}\t{recall}\t{precision}"
-                        writer.write(f"{content}\n")
-
-                        count += 1
-                        if count > self.num_libs - number_of_topics_from_ease:
-                            break
-            except IOError as e:
-                self.logger.error(e)
     def compute_average_precision_recall(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-        precision_map = {}
-        recall_map = {}
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            pr_file = str(Path(self.pr_dir) / filename)
-
-            try:
-                with open(pr_file, 'r') as f:
-                    id = 1
-                    for line in f:
-                        vals = line.strip().split("\t")
-                        recall = float(vals[1])
-                        precision = float(vals[2])
-
-                        if id in recall_map:
-                            recall_map[id] += recall
-                            precision_map[id] += precision
-                        else:
-                            recall_map[id] = recall
-                            precision_map[id] = precision
-
-                        id += 1
-                        if id > self.num_libs:
-                            break
-            except IOError as e:
-                self.logger.error(e)
-
-        size = len(self.testing_projects)
-        output_file = str(Path(self.res_dir) / f"PRC_Round{self.fold}")
-
-        try:
-            with open(output_file, 'w') as writer:
-                for key in sorted(precision_map.keys()):
-                    recall = recall_map[key] / size if size != 0 else 0
-                    precision = precision_map[key] / size if size != 0 else 0
-                    content = f"{key}\t{recall}\t{precision}"
-                    writer.write(f"{content}\n")
-        except IOError as e:
-            self.logger.error(e)
+        self.evaluate(["PRC"])
 
     def compute_average_precision_recall_b(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-        precision_map = {}
-        recall_map = {}
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            pr_file = str(Path(self.pr_dir_b) / filename)
-
-            try:
-                with open(pr_file, 'r') as f:
-                    id = 1
-                    for line in f:
-                        vals = line.strip().split("\t")
-                        recall = float(vals[1])
-                        precision = float(vals[2])
-
-                        if id in recall_map:
-                            recall_map[id] += recall
-                            precision_map[id] += precision
-                        else:
-                            recall_map[id] = recall
-                            precision_map[id] = precision
-
-                        id += 1
-                        if id > self.num_libs:
-                            break
-            except IOError as e:
-                self.logger.error(e)
-
-        size = len(self.testing_projects)
-        output_file = str(Path(self.res_dir) / f"PRCB_Round{self.fold}")
-
-        try:
-            with open(output_file, 'w') as writer:
-                for key in sorted(precision_map.keys()):
-                    recall = recall_map[key] / size if size != 0 else 0
-                    precision = precision_map[key] / size if size != 0 else 0
-                    content = f"{key}\t{recall}\t{precision}"
-                    writer.write(f"{content}\n")
-        except IOError as e:
-            self.logger.error(e)
+        self.evaluate(["PRCB"], bayesian=True)
 
     def init_sr_map(self) -> Dict[int, float]:
         return {i: 0.0 for i in range(1, 21)}
 
     def compute_average_success_rate_n(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-        sr_map1 = self.init_sr_map()
-        sr_map2 = self.init_sr_map()
-        sr_map3 = self.init_sr_map()
-        sr_map4 = self.init_sr_map()
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            sr_file = str(Path(self.success_rate_dir_n) / filename)
-
-            try:
-                with open(sr_file, 'r') as f:
-                    id = 1
-                    for line in f:
-                        vals = line.strip().split("\t")
-                        success_rate = float(vals[1])
-
-                        sr1 = sr_map1[id]
-                        sr2 = sr_map2[id]
-                        sr3 = sr_map3[id]
-                        sr4 = sr_map4[id]
-
-                        if success_rate == 1:
-                            sr1 += 1
-                        elif 1 < success_rate < 3:
-                            sr1 += 1
-                            sr2 += 1
-                        elif 2 < success_rate < 4:
-                            sr1 += 1
-                            sr2 += 1
-                            sr3 += 1
-                        elif success_rate > 3:
-                            sr1 += 1
-                            sr2 += 1
-                            sr3 += 1
-                            sr4 += 1
-
-                        sr_map1[id] = sr1
-                        sr_map2[id] = sr2
-                        sr_map3[id] = sr3
-                        sr_map4[id] = sr4
-
-                        id += 1
-                        if id > self.num_libs:
-                            break
-            except IOError as e:
-                self.logger.error(e)
-
-        size = len(self.testing_projects)
-        output_file = str(Path(self.res_dir) / f"SR_STAR_Round{self.fold}")
-        
-        try:
-            with open(output_file, 'w') as writer:
-                for key in sorted(sr_map1.keys()):
-                    sr1 = sr_map1[key] / size if size != 0 else 0
-                    sr2 = sr_map2[key] / size if size != 0 else 0
-                    sr3 = sr_map3[key] / size if size != 0 else 0
-                    sr4 = sr_map4[key] / size if size != 0 else 0
-                    content = f"{key}\t{sr1:.03f}\t{sr2:.03f}\t{sr3:.03f}\t{sr4:.03f}"
-                    writer.write(f"{content}\n")
-        except IOError as e:
-            self.logger.error(e)
+        self.evaluate(["SR_STAR"])
 
     def compute_average_success_rate_b(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-        sr_map = {}
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            sr_file = str(Path(self.success_rate_dir_b) / filename)
-
-            try:
-                with open(sr_file, 'r') as f:
-                    id = 1
-                    for line in f:
-                        vals = line.strip().split("\t")
-                        success_rate = float(vals[1])
-                        
-                        if id in sr_map:
-                            sr_map[id] += success_rate
-                        else:
-                            sr_map[id] = success_rate
-                        
-                        id += 1
-                        if id > self.num_libs:
-                            break
-            except IOError as e:
-                self.logger.error(e)
-
-        size = len(self.testing_projects)
-        output_file = str(Path(self.res_dir) / f"SRB_Round{self.fold}")
-        
-        try:
-            with open(output_file, 'w') as writer:
-                for key in sorted(sr_map.keys()):
-                    sr = sr_map[key] / size if size != 0 else 0
-                    content = f"{key}\t{sr}"
-                    writer.write(f"{content}\n")
-        except IOError as e:
-            self.logger.error(e)
+        self.evaluate(["SRB"], bayesian=True)
 
     def compute_average_success_rate(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-        sr_map = {}
-
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            sr_file = str(Path(self.success_rate_dir) / filename)
-
-            try:
-                with open(sr_file, 'r') as f:
-                    id = 1
-                    for line in f:
-                        vals = line.strip().split("\t")
-                        success_rate = float(vals[1])
-                        
-                        if id in sr_map:
-                            sr_map[id] += success_rate
-                        else:
-                            sr_map[id] = success_rate
-                        
-                        id += 1
-                        if id > self.num_libs:
-                            break
-                    
-                    # Fill remaining positions if needed
-                    while id <= self.num_libs:
-                        if id in sr_map:
-                            sr_map[id] += success_rate
-                        else:
-                            sr_map[id] = success_rate
-                        id += 1
-            except IOError as e:
-                self.logger.error(e)
-
-        size = len(self.testing_projects)
-        output_file = str(Path(self.res_dir) / f"SR_Round{self.fold}")
-        
-        try:
-            with open(output_file, 'w') as writer:
-                for key in sorted(sr_map.keys()):
-                    sr = sr_map[key] / size if size != 0 else 0
-                    content = f"{key}\t{sr}"
-                    writer.write(f"{content}\n")
-        except IOError as e:
-            self.logger.error(e)
+        self.evaluate(["SR"])
 
     def get_f_scores(self, cut_off_value: int) -> Dict[str, float]:
         key_testing_projects = self.testing_projects.keys()
@@ -652,8 +256,7 @@ class Metrics:
 
         for key, project in training_projects.items():
             filename = project.replace("git://github.com/", "").replace("/", "__")
-            training_dict_file = str(Path(self.src_dir) / f"dicth_{filename}")
-            all_items.update(self.reader.get_libraries(training_dict_file))
+            all_items.update(self.store.get_libraries(filename))
 
         return all_items
 
@@ -665,9 +268,8 @@ class Metrics:
         for i in range(1, 11):
             for key_testing in key_testing_projects:
                 testing_pro = self.testing_projects[key_testing]
-                testing_recs_path = str(Path(self.rec_dir) / testing_pro)
                 ease_topics = self.reader.get_EASE_topic(testing_pro, self._NUM_OF_MNBN_TOPIC)
-                recs = list(self.reader.read_recommendation_file_with_size(testing_recs_path, i))
+                recs = list(self.read_recommendation_file_with_size(testing_pro, i))
                 ease_topics.extend(recs)
                 
                 try:
@@ -689,33 +291,7 @@ class Metrics:
             self.logger.error(str(e))
 
     def catalog_coverage(self) -> None:
-        key_testing_projects = self.testing_projects.keys()
-        all_items = len(self.get_all_items())
-        size_map = defaultdict(set)
-
-        for i in range(1, 11):
-            for key_testing in key_testing_projects:
-                testing_pro = self.testing_projects[key_testing]
-                testing_recs_path = str(Path(self.rec_dir) / testing_pro)
-                recs = list(self.reader.read_recommendation_file_with_size(testing_recs_path, i))
-                
-                try:
-                    if len(recs) >= i:
-                        size_map[i].update(recs[:i])
-                    else:
-                        size_map[i].update(recs)
-                except Exception as e:
-                    self.logger.error(f"{i} {testing_pro.replace('___', '/')} {str(e)}")
-                    raise
-
-        output_file = str(Path(self.res_dir) / f"Catalog{self.fold}")
-        try:
-            with open(output_file, 'w') as writer:
-                for size, items in sorted(size_map.items()):
-                    coverage = len(items) / all_items
-                    writer.write(f"{size}\t{coverage}\n")
-        except IOError as e:
-            self.logger.error(str(e))
+        self.evaluate(["Catalog"])
 
     def long_tail(self, n: int, long_tail_items: Set[str], rec: Dict[str, Dict[int, str]]) -> float:
         all_recs = defaultdict(int)
@@ -738,8 +314,7 @@ class Metrics:
         for key_testing in key_testing_projects:
             testing_pro = self.testing_projects[key_testing]
             filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_all_recommendations(rec_file)
+            recommendations = self.read_all_recommendations(filename)
             rec[filename] = recommendations
 
         output_file = str(Path(self.res_dir) / f"LongTail_Round{self.fold}")
@@ -771,6 +346,17 @@ class Metrics:
 
         return total_ndcg / len(rec) if rec else 0
 
+    def ndcg_at_cut_offs(self, rec: Dict[str, Dict[int, str]], gt: Dict[str, Set[str]]) -> List[float]:
+        """
+        ndcg(n, rec, gt) for every n from 1 to num_libs, from one hit matrix.
+        """
+        if not rec:
+            return [0] * self.num_libs
+        hits = hit_matrix.hit_matrix([list(recommendations.values()) for recommendations in rec.values()],
+                                     [gt[project] for project in rec], self.num_libs, distinct=False)
+        values = hit_matrix.ndcg(hits, np.array([len(gt[project]) for project in rec], dtype=np.int64))
+        return (hit_matrix.column_sums(values) / len(rec)).tolist()
+
     def ndcg_analysis(self) -> None:
         key_testing_projects = self.testing_projects.keys()
         rec = {}
@@ -780,19 +366,16 @@ class Metrics:
             testing_pro = self.testing_projects[key_testing]
             filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
             
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_all_recommendations(rec_file)
+            recommendations = self.read_all_recommendations(filename)
             rec[filename] = recommendations
             
-            gt_file = str(Path(self.ground_truth) / filename)
-            ground_truth = self.reader.read_ground_truth_file(gt_file)
+            ground_truth = self.read_ground_truth_file(filename)
             gt[filename] = ground_truth
 
         output_file = str(Path(self.res_dir) / f"nDCG_Round{self.fold}")
         try:
             with open(output_file, 'w') as writer:
-                for i in range(1, self.num_libs + 1):
-                    ndcg = self.ndcg(i, rec, gt)
+                for ndcg in self.ndcg_at_cut_offs(rec, gt):
                     writer.write(f"{ndcg}\n")
         except IOError as e:
             self.logger.error(str(e))
@@ -824,8 +407,7 @@ class Metrics:
         for key_testing in key_testing_projects:
             testing_pro = self.testing_projects[key_testing]
             filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_all_recommendations(rec_file)
+            recommendations = self.read_all_recommendations(filename)
             rec[key_testing] = recommendations
 
         output_file = str(Path(self.res_dir) / f"Entropy_Round{self.fold}")
@@ -840,31 +422,52 @@ class Metrics:
     def epc_analysis(self) -> None:
         key_testing_projects = self.testing_projects.keys()
         rec = {}
+        gt = {}
 
         for key_testing in key_testing_projects:
             testing_pro = self.testing_projects[key_testing]
             filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_all_recommendations(rec_file)
+            recommendations = self.read_all_recommendations(filename)
             rec[filename] = recommendations
+            gt[filename] = self.read_ground_truth_file(filename)
 
         output_file = str(Path(self.res_dir) / f"EPC_Round{self.fold}")
         try:
             with open(output_file, 'w') as writer:
-                for i in range(1, self.num_libs + 1):
-                    epc = self.epc(i, rec)
+                for epc in self.epc_at_cut_offs(rec, self.popularity(), gt):
                     writer.write(f"{epc}\n")
         except IOError as e:
             self.logger.error(str(e))
 
-    def epc(self, n: int, rec: Dict[str, Dict[int, str]]) -> float:
-        pop = self.popularity()
+    def epc_at_cut_offs(self, rec: Dict[str, Dict[int, str]], pop: Dict[str, float],
+                        gt: Dict[str, Set[str]]) -> List[float]:
+        """
+        epc(n, rec) for every n from 1 to num_libs in one sweep: each relevant
+        recommendation at position pos counts for every cut-off from pos on.
+        """
+        numerators = np.zeros(self.num_libs)
+        denominators = np.zeros(self.num_libs)
+
+        for project, recommendations in rec.items():
+            ground_truth = gt[project]
+            for pos, lib in recommendations.items():
+                if pos <= self.num_libs and lib in ground_truth:
+                    discount = math.log2(pos + 1)
+                    numerators[pos - 1:] += (1 - pop.get(lib, 0)) / discount
+                    denominators[pos - 1:] += 1 / discount
+
+        return [numerator / denominator if denominator != 0 else 0
+                for numerator, denominator in zip(numerators.tolist(), denominators.tolist())]
+
+    def epc(self, n: int, rec: Dict[str, Dict[int, str]], pop: Optional[Dict[str, float]] = None,
+            gt: Optional[Dict[str, Set[str]]] = None) -> float:
+        if pop is None:
+            pop = self.popularity()
         numerator = 0.0
         denominator = 0.0
 
         for project, recommendations in rec.items():
-            gt_file = str(Path(self.ground_truth) / project)
-            ground_truth = self.reader.read_ground_truth_file(gt_file)
+            ground_truth = gt[project] if gt is not None else self.read_ground_truth_file(project)
             top_n = {k: v for k, v in recommendations.items() if k <= n}
             
             for pos, lib in top_n.items():
@@ -875,16 +478,19 @@ class Metrics:
 
         return numerator / denominator if denominator != 0 else 0
 
-    def popularity(self) -> Dict[str, float]:
+    def popularity(self, top_recommendations: Optional[Dict[str, Dict[int, str]]] = None) -> Dict[str, float]:
+        """
+        Share of the testing projects recommending each library, relative to the
+        most recommended one, from their top 50 recommendations (read unless given).
+        """
         pop = defaultdict(int)
-        key_testing_projects = self.testing_projects.keys()
+        if top_recommendations is None:
+            top_recommendations = {}
+            for testing_pro in self.testing_projects.values():
+                filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+                top_recommendations[filename] = self.read_recommendation_file(filename)
 
-        for key_testing in key_testing_projects:
-            testing_pro = self.testing_projects[key_testing]
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_recommendation_file(rec_file)
-            
+        for recommendations in top_recommendations.values():
             for lib in recommendations.values():
                 pop[lib] += 1
 
@@ -898,8 +504,7 @@ class Metrics:
         for key_testing in key_testing_projects:
             testing_pro = self.testing_projects[key_testing]
             filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_recommendation_file(rec_file)
+            recommendations = self.read_recommendation_file(filename)
             
             for lib in recommendations.values():
                 freq[lib] += 1
@@ -910,29 +515,22 @@ class Metrics:
         testing_projects = self.reader.read_project_list(
             str(Path(self.src_dir) / "projects.txt"), start_pos, end_pos)
         all_recs = {}
+        # Number of projects recommending each library
+        counts = defaultdict(int)
         total_ebn = 0.0
 
-        # First pass: collect all recommendations
         for key, project in testing_projects.items():
             filename = project.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_recommendation_file(rec_file)
-            all_recs[key] = set(recommendations.values())
+            recommendations = self.read_recommendation_file(filename)
+            all_recs[key] = recommendations
+            for lib in set(recommendations.values()):
+                counts[lib] += 1
 
-        # Second pass: compute EBN for each project
-        for key, project in testing_projects.items():
-            filename = project.replace("git://github.com/", "").replace("/", "__")
-            rec_file = str(Path(self.rec_dir) / filename)
-            recommendations = self.reader.read_recommendation_file(rec_file)
-            
+        for key, recommendations in all_recs.items():
             project_ebn = 0.0
             for pos, lib in sorted(recommendations.items()):
-                count = 0
-                for other_key, other_recs in all_recs.items():
-                    if other_key != key and lib in other_recs:
-                        count += 1
-                
-                prob = count / len(testing_projects)
+                # The project itself is among the ones recommending lib
+                prob = (counts[lib] - 1) / len(testing_projects)
                 if prob > 0:
                     project_ebn += -prob * math.log2(prob)
             
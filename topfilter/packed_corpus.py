@@ -0,0 +1,213 @@
+import os
+import mmap
+import struct
+import logging
+import argparse
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+
+class PackedCorpus:
+    """
+    Single-file, memory-mapped form of a TopFilter dataset: every project's
+    dicth_ lines and graph_ edges in one file instead of two small files per
+    project. All integers are little endian and every section starts on an
+    8-byte boundary:
+
+        header          magic, num_strings, num_projects, num_entries, num_edges
+        string_offsets  int64[num_strings + 1]    string table
+        string_data     utf-8 bytes
+        project_names   int32[num_projects]       string id of each project (file stem)
+        dict_indptr     int64[num_projects + 1]   CSR project -> dicth_ lines
+        dict_ids        int32[num_entries]        node id of each line
+        dict_strings    int32[num_entries]        string id of each line's artifact
+        edge_indptr     int64[num_projects + 1]   CSR project -> graph_ edges
+        edge_src        int32[num_edges]
+        edge_dst        int32[num_edges]
+    """
+
+    FILENAME = "corpus.tfpack"
+    MAGIC = b"TFPACK01"
+    HEADER = struct.Struct("<8sqqqq")
+
+    _corpora: Dict[str, Tuple[Tuple[int, int], Optional['PackedCorpus']]] = {}
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.logger = logging.getLogger(__name__)
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, num_strings, num_projects, num_entries, num_edges = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            raise IOError(f"{filename} is not a packed TopFilter corpus")
+
+        offset = self.HEADER.size
+        self.string_offsets, offset = self._array(offset, np.int64, num_strings + 1)
+        self._string_data = offset
+        offset = _aligned(offset + int(self.string_offsets[-1]))
+        project_names, offset = self._array(offset, np.int32, num_projects)
+        self.dict_indptr, offset = self._array(offset, np.int64, num_projects + 1)
+        self.dict_ids, offset = self._array(offset, np.int32, num_entries)
+        self.dict_strings, offset = self._array(offset, np.int32, num_entries)
+        self.edge_indptr, offset = self._array(offset, np.int64, num_projects + 1)
+        self.edge_src, offset = self._array(offset, np.int32, num_edges)
+        self.edge_dst, offset = self._array(offset, np.int32, num_edges)
+
+        # Project index: file stem -> row
+        self.index = {self.get_string(int(s)): row for row, s in enumerate(project_names.tolist())}
+
+    def _array(self, offset: int, dtype, count: int) -> Tuple[np.ndarray, int]:
+        array = np.frombuffer(self._mmap, dtype=np.dtype(dtype).newbyteorder("<"), count=count, offset=offset)
+        return array, _aligned(offset + array.nbytes)
+
+    @classmethod
+    def for_directory(cls, src_dir: str) -> Optional['PackedCorpus']:
+        """
+        Return the (shared) packed corpus of a dataset directory, or None when
+        the dataset only has the loose dicth_/graph_ files.
+        """
+        filename = os.path.join(src_dir, cls.FILENAME)
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = os.path.abspath(filename)
+        entry = cls._corpora.get(key)
+        if entry is None or entry[0] != stamp:
+            try:
+                corpus = cls(filename)
+            except (IOError, ValueError, struct.error) as e:
+                logging.getLogger(__name__).error(f"Error opening packed corpus {filename}: {e}")
+                corpus = None
+            entry = (stamp, corpus)
+            cls._corpora[key] = entry
+        return entry[1]
+
+    def __contains__(self, project: str) -> bool:
+        return project in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_string(self, string_id: int) -> str:
+        start = self._string_data + int(self.string_offsets[string_id])
+        end = self._string_data + int(self.string_offsets[string_id + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def get_dictionary_lines(self, project: str) -> List[Tuple[int, str]]:
+        """
+        (id, artifact) lines of the project's dicth_ file, in file order.
+        """
+        row = self.index[project]
+        start, end = int(self.dict_indptr[row]), int(self.dict_indptr[row + 1])
+        return [(ID, self.get_string(s))
+                for ID, s in zip(self.dict_ids[start:end].tolist(), self.dict_strings[start:end].tolist())]
+
+    def get_out_links(self, project: str) -> Dict[int, Set[int]]:
+        row = self.index[project]
+        start, end = int(self.edge_indptr[row]), int(self.edge_indptr[row + 1])
+        out_links = defaultdict(set)
+        for start_node, end_node in zip(self.edge_src[start:end].tolist(), self.edge_dst[start:end].tolist()):
+            out_links[start_node].add(end_node)
+        return dict(out_links)
+
+    @classmethod
+    def write(cls, filename: str, projects: Iterable[Tuple[str, List[Tuple[int, str]], List[Tuple[int, int]]]]):
+        """
+        Write (file stem, dicth_ lines, graph_ edges) of every project to a packed corpus.
+        """
+        strings: Dict[str, int] = {}
+
+        def string_id(s: str) -> int:
+            sid = strings.get(s)
+            if sid is None:
+                sid = len(strings)
+                strings[s] = sid
+            return sid
+
+        names = []
+        dict_indptr, dict_ids, dict_strings = [0], [], []
+        edge_indptr, edge_src, edge_dst = [0], [], []
+        for project, lines, edges in projects:
+            names.append(string_id(project))
+            for ID, artifact in lines:
+                dict_ids.append(ID)
+                dict_strings.append(string_id(artifact))
+            dict_indptr.append(len(dict_ids))
+            for start_node, end_node in edges:
+                edge_src.append(start_node)
+                edge_dst.append(end_node)
+            edge_indptr.append(len(edge_src))
+
+        encoded = [s.encode("utf-8") for s in strings]
+        string_offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(b) for b in encoded], out=string_offsets[1:])
+
+        with open(filename, 'wb') as writer:
+            writer.write(cls.HEADER.pack(cls.MAGIC, len(encoded), len(names), len(dict_ids), len(edge_src)))
+            _write_array(writer, string_offsets)
+            writer.write(b"".join(encoded))
+            _pad(writer)
+            for array, dtype in ((names, '<i4'), (dict_indptr, '<i8'), (dict_ids, '<i4'), (dict_strings, '<i4'),
+                                 (edge_indptr, '<i8'), (edge_src, '<i4'), (edge_dst, '<i4')):
+                _write_array(writer, np.asarray(array, dtype=dtype))
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _pad(writer):
+    writer.write(b"\0" * (_aligned(writer.tell()) - writer.tell()))
+
+
+def _write_array(writer, array: np.ndarray):
+    writer.write(array.tobytes())
+    _pad(writer)
+
+
+def read_loose_project(src_dir: str, project: str) -> Tuple[List[Tuple[int, str]], List[Tuple[int, int]]]:
+    lines, edges = [], []
+    with open(os.path.join(src_dir, f"dicth_{project}"), 'r') as reader:
+        for line in reader:
+            vals = line.split("\t")
+            lines.append((int(vals[0].strip()), vals[1].strip()))
+    with open(os.path.join(src_dir, f"graph_{project}"), 'r') as reader:
+        for line in reader:
+            pair = line.strip().split("#")
+            edges.append((int(pair[0].strip()), int(pair[1].strip())))
+    return lines, edges
+
+
+def pack_directory(src_dir: str):
+    """
+    Pack the loose dicth_/graph_ files of every project listed in projects.txt.
+    """
+    logger = logging.getLogger(__name__)
+    projects = []
+    with open(os.path.join(src_dir, "projects.txt"), 'r') as reader:
+        for line in reader:
+            project = line.strip().split(",")[0].strip()
+            if project:
+                projects.append(project.replace("git://github.com/", "").replace("/", "__"))
+
+    def records():
+        for project in projects:
+            try:
+                lines, edges = read_loose_project(src_dir, project)
+            except IOError as e:
+                logger.error(f"Skipping {project}: {e}")
+                continue
+            yield project, lines, edges
+
+    PackedCorpus.write(os.path.join(src_dir, PackedCorpus.FILENAME), records())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Pack the dicth_/graph_ files of a TopFilter dataset")
+    parser.add_argument("src_dir", help="dataset directory containing projects.txt")
+    pack_directory(parser.parse_args().src_dir)
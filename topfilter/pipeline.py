@@ -0,0 +1,75 @@
+import math
+from typing import Dict, List, Optional, Set, Tuple
+from split_manager import SplitManager
+
+
+def project_key(project: str) -> str:
+    return project.replace("git://github.com/", "").replace("/", "__")
+
+
+def fold_step(num_of_projects: int) -> int:
+    """
+    Number of testing projects of each of the ten folds; fold i tests projects 1 + i * step..(i + 1) * step.
+    """
+    return math.ceil(num_of_projects / 10)
+
+
+class FoldData:
+    """
+    In-memory artefacts of one fold, handed from the similarity stage to the
+    recommendation stage and on to Metrics instead of going through the
+    Similarities/, Recommendations/ and GroundTruth/ files. Projects are keyed
+    by file stem. The readers mirror the DataReader functions Metrics uses on
+    the corresponding files.
+    """
+
+    def __init__(self, splits: SplitManager):
+        self.splits = splits
+        # testing project -> ranked (training project URI, similarity)
+        self.similarities: Dict[str, List[Tuple[str, float]]] = {}
+        # testing project -> (library, score) in the order of the recommendation file
+        self.recommendations: Dict[str, List[Tuple[str, float]]] = {}
+
+    def set_similarities(self, project: str, similarities: List[Tuple[str, float]]):
+        self.similarities[project_key(project)] = similarities
+
+    def set_recommendations(self, project: str, recommendations: List[Tuple[str, float]]):
+        self.recommendations[project_key(project)] = recommendations
+
+    def get_neighbours(self, project: str, size: int) -> Optional[Tuple[Dict[int, str], Dict[int, float]]]:
+        """
+        Top neighbours and similarities keyed by rank, or None when the fold has none in memory.
+        """
+        similarities = self.similarities.get(project_key(project))
+        if similarities is None:
+            return None
+        top = similarities[:size]
+        return ({rank: pro for rank, (pro, _) in enumerate(top)},
+                {rank: score for rank, (_, score) in enumerate(top)})
+
+    def read_recommendation_file(self, project: str) -> Dict[int, str]:
+        recommendations = self.recommendations.get(project_key(project), [])
+        return {i: lib for i, (lib, _) in enumerate(recommendations[:50], 1)}
+
+    def read_all_recommendations(self, project: str) -> Dict[int, str]:
+        recommendations = self.recommendations.get(project_key(project), [])
+        return {i: lib for i, lib in enumerate((lib for lib, score in recommendations if score != 0), 1)}
+
+    def read_recommendation_file_with_size(self, project: str, size: int) -> Set[str]:
+        return {lib for lib, _ in self.recommendations.get(project_key(project), [])[:size]}
+
+    def read_recommendation_scores(self, project: str) -> Dict[str, float]:
+        return {lib: float(score) for lib, score in self.recommendations.get(project_key(project), [])}
+
+    def read_ranked_recommendations(self, project: str) -> List[Tuple[str, float]]:
+        return [(lib, float(score)) for lib, score in self.recommendations.get(project_key(project), [])]
+
+    def read_ground_truth_file(self, project: str) -> Set[str]:
+        return {artifact for _, artifact in self.splits.get_ground_truth(project_key(project))}
+
+    def read_ground_truth_score(self, project: str) -> Dict[str, float]:
+        ret = {}
+        for _, artifact in self.splits.get_ground_truth(project_key(project)):
+            temp = artifact.strip().split("%")
+            ret[temp[0].strip()] = float(temp[1].strip())
+        return ret
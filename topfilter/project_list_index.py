@@ -0,0 +1,111 @@
+import os
+import struct
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+class ProjectListIndex:
+    """
+    Byte offset of every line of a projects.txt file, persisted beside it in
+    <file>.idx and rebuilt when the file's mtime or size changes, so that the
+    number of projects is known without reading the file. The project names
+    are parsed on first use; the index of a file and its names are shared by
+    every reader of the process.
+    """
+
+    SUFFIX = ".idx"
+    # mtime_ns, size and number of lines of the indexed file
+    HEADER = struct.Struct("<qqq")
+
+    _indexes: Dict[str, 'ProjectListIndex'] = {}
+
+    def __init__(self, filename: str, stamp: Tuple[int, int], offsets: np.ndarray,
+                 names: Optional[List[str]] = None):
+        self.filename = filename
+        self.stamp = stamp
+        # offsets[i] is the start of line i + 1, offsets[-1] the end of the file
+        self.offsets = offsets
+        self.names = names
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def for_file(cls, filename: str) -> 'ProjectListIndex':
+        """
+        Return the up-to-date index of the file; raises OSError when the file cannot be read.
+        """
+        stat = os.stat(filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = os.path.abspath(filename)
+        index = cls._indexes.get(key)
+        if index is None or index.stamp != stamp:
+            index = cls._load(filename, stamp) or cls._build(filename, stamp)
+            cls._indexes[key] = index
+        return index
+
+    @classmethod
+    def _load(cls, filename: str, stamp: Tuple[int, int]) -> Optional['ProjectListIndex']:
+        try:
+            with open(filename + cls.SUFFIX, 'rb') as reader:
+                header = reader.read(cls.HEADER.size)
+                if len(header) != cls.HEADER.size:
+                    return None
+                mtime, size, num_lines = cls.HEADER.unpack(header)
+                if (mtime, size) != stamp:
+                    return None
+                offsets = np.fromfile(reader, dtype='<i8')
+        except IOError:
+            return None
+        if len(offsets) != num_lines + 1:
+            return None
+        return cls(filename, stamp, offsets)
+
+    @classmethod
+    def _build(cls, filename: str, stamp: Tuple[int, int]) -> 'ProjectListIndex':
+        with open(filename, 'rb') as reader:
+            data = reader.read()
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n")) + 1
+        offsets = np.concatenate(([0], ends)).astype('<i8')
+        if offsets[-1] != len(data):
+            offsets = np.append(offsets, len(data)).astype('<i8')
+
+        index = cls(filename, stamp, offsets, cls._parse(data))
+        index.save()
+        return index
+
+    @staticmethod
+    def _parse(data: bytes) -> List[str]:
+        lines = data.decode("utf-8").split("\n")
+        if lines and lines[-1] == "":
+            lines.pop()
+        return [line.strip().split(",")[0].strip() for line in lines]
+
+    def save(self):
+        try:
+            with open(self.filename + self.SUFFIX, 'wb') as writer:
+                writer.write(self.HEADER.pack(self.stamp[0], self.stamp[1], self.num_lines()))
+                self.offsets.tofile(writer)
+        except IOError as e:
+            self.logger.error(f"Error writing project index {self.filename}{self.SUFFIX}: {e}")
+
+    def num_lines(self) -> int:
+        return len(self.offsets) - 1
+
+    def get_names(self, first: int, last: int) -> List[str]:
+        """
+        Project names of lines first..last (1-based, inclusive, clipped to the file).
+        """
+        first = max(first, 1)
+        last = min(last, self.num_lines())
+        if first > last:
+            return []
+        return self.all_names()[first - 1:last]
+
+    def all_names(self) -> List[str]:
+        """
+        Project names of the whole file, parsed once and shared.
+        """
+        if self.names is None:
+            with open(self.filename, 'rb') as reader:
+                self.names = self._parse(reader.read())
+        return self.names
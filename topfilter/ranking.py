@@ -0,0 +1,32 @@
+import heapq
+from typing import Dict, List, Optional, Tuple, TypeVar
+import numpy as np
+
+K = TypeVar('K')
+
+
+def rank_scores(scores: Dict[K, float], top_k: Optional[int] = None) -> List[Tuple[K, float]]:
+    """
+    Sort scores in decreasing order, ties keeping insertion order. With top_k
+    only the k best non-zero scores are kept, selected with a heap.
+    """
+    if top_k is None:
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return heapq.nlargest(top_k, ((key, score) for key, score in scores.items() if score != 0),
+                          key=lambda x: x[1])
+
+
+def rank_indices(scores: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+    """
+    Indices of scores in decreasing order, ties keeping index order. With top_k
+    only the k best non-zero scores are kept, selected with argpartition.
+    """
+    if top_k is None:
+        return np.argsort(-scores, kind="stable")
+
+    candidates = np.flatnonzero(scores)
+    if len(candidates) > top_k:
+        threshold = -np.partition(-scores[candidates], top_k - 1)[top_k - 1]
+        candidates = candidates[scores[candidates] >= threshold]
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return order[:top_k]
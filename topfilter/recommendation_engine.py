@@ -6,222 +6,278 @@ from collections import defaultdict, OrderedDict
 from typing import Dict, List, Set, Tuple, Optional, Any, Union
 import heapq
 import csv
+import numpy as np
 from data_reader import DataReader
+from corpus_store import CorpusStore
+from ranking import rank_scores
+from item_similarity_index import ItemSimilarityIndex
+from user_item_matrix import UserItemMatrix
+from sharding import map_sharded
+from split_manager import SplitManager
+from similarity_store import SimilarityStore
+from project_list_index import ProjectListIndex
+from pipeline import FoldData
 
 class RecommendationEngine:
     def __init__(self, source_dir: str, sub_folder: str, num_of_neighbours: int, 
-                 testing_start_pos: int, testing_end_pos: int, bayesian: bool):
+                 testing_start_pos: int, testing_end_pos: int, bayesian: bool,
+                 store: Optional[CorpusStore] = None, top_k: Optional[int] = None,
+                 splits: Optional[SplitManager] = None, binary_store: bool = False,
+                 fold_data: Optional[FoldData] = None, persist: bool = True):
         self.src_dir = source_dir
         self.sub_folder = sub_folder
         self.num_of_neighbours = num_of_neighbours
         self.rec_dir = os.path.join(self.src_dir, sub_folder, "Recommendations")
         self.sim_dir = os.path.join(self.src_dir, sub_folder, "Similarities")
+        self.similarity_file = os.path.join(self.src_dir, sub_folder, SimilarityStore.FILENAME)
+        self.binary_store = binary_store
+        self.fold_data = fold_data
+        self.persist = persist
+        self._similarity_store: Optional[SimilarityStore] = None
+        self._testing_ids: Dict[str, int] = {}
         self.ground_truth = os.path.join(self.src_dir, sub_folder, "GroundTruth")
+        self.item_index_dir = os.path.join(self.src_dir, sub_folder, "ItemIndex")
         self.reader = DataReader(source_dir)
+        self.store = store or CorpusStore.for_dataset(source_dir)
+        self.top_k = top_k
         self.testing_start_pos = testing_start_pos
         self.testing_end_pos = testing_end_pos
         self.bayesian = bayesian
         self.num_of_EASE_input = 5
+        self.splits = splits or SplitManager(source_dir, sub_folder, bayesian, self.num_of_EASE_input, self.reader)
         self.logger = logging.getLogger(__name__)
 
-    def build_user_item_matrix(self, testing_pro: str, lib_set: List[str]) -> List[List[float]]:
+    def get_testing_libraries(self, testing_pro: str) -> Set[str]:
         filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-        testing_filename = filename
-        testing_dict_filename = os.path.join(self.src_dir, f"dicth_{testing_filename}")
+        testing_dictionary = self.splits.get_query(filename)
+        return {v for v in testing_dictionary.values() if v.startswith("#DEP#")}
+
+    def read_neighbours(self, testing_pro: str) -> Tuple[Dict[int, str], Dict[int, float]]:
+        """
+        The num_of_neighbours most similar projects of a testing project and their
+        similarities, keyed by rank, from the in-memory fold data when it has them,
+        the binary similarity store when enabled and the Similarities/ TSV file otherwise.
+        """
+        if self.fold_data is not None:
+            neighbours = self.fold_data.get_neighbours(testing_pro, self.num_of_neighbours)
+            if neighbours is not None:
+                return neighbours
         
-        testing_dictionary = (self.reader.extract_EASE_dictionary(testing_dict_filename, self.num_of_EASE_input, self.ground_truth) 
-                            if self.bayesian 
-                            else self.reader.extract_half_dictionary(testing_dict_filename, self.ground_truth, False))
+        filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+        if not self.binary_store:
+            tmp = os.path.join(self.sim_dir, filename)
+            return (self.reader.get_most_similar_projects(tmp, self.num_of_neighbours),
+                    self.reader.get_similarity_matrix(tmp, self.num_of_neighbours))
         
-        testing_libs = {v for v in testing_dictionary.values() if v.startswith("#DEP#")}
+        projects_file = os.path.join(self.src_dir, "projects.txt")
+        if self._similarity_store is None:
+            self._similarity_store = SimilarityStore.open(self.similarity_file)
+            testing_projects = self.reader.read_project_list(projects_file, self.testing_start_pos, self.testing_end_pos)
+            self._testing_ids = {pro: key for key, pro in testing_projects.items()}
+        if self._similarity_store is None or testing_pro not in self._testing_ids:
+            return {}, {}
         
-        tmp = os.path.join(self.sim_dir, filename)
-        sim_projects = self.reader.get_most_similar_projects(tmp, self.num_of_neighbours)
+        names = ProjectListIndex.for_file(projects_file).all_names()
+        neighbours, scores = self._similarity_store.get(self._testing_ids[testing_pro], self.num_of_neighbours)
+        return ({rank: names[neighbour - 1] for rank, neighbour in enumerate(neighbours.tolist())},
+                dict(enumerate(scores.tolist())))
+
+    def write_recommendations(self, testing_pro: str, recommendations: List[Tuple[str, Any]]):
+        """
+        Write the ranked (library, score) recommendations of a testing project to
+        Recommendations/, unless the engine does not persist its output.
+        """
+        if not self.persist:
+            return
+        filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+        tmp = os.path.join(self.rec_dir, filename)
         
-        all_neighbour_libs = {}
-        libraries = set()
+        try:
+            with open(tmp, 'w') as writer:
+                writer.write("".join(f"{lib}\t{score}\n" for lib, score in recommendations))
+        except IOError as e:
+            self.logger.error(f"Error writing recommendations to {tmp}: {e}")
+
+    def emit_recommendations(self, testing_pro: str, recommendations: List[Tuple[str, Any]]):
+        self.write_recommendations(testing_pro, recommendations)
+        if self.fold_data is not None:
+            self.fold_data.set_recommendations(testing_pro, recommendations)
+
+    def build_user_item_matrix(self, testing_pro: str, lib_set: List[str]) -> UserItemMatrix:
+        """
+        Build the neighbourhood matrix of a testing project and append the
+        library name of every column to lib_set. Columns are sorted by library
+        name, so libraries with equal scores rank the same whichever folds
+        registered them in the shared corpus store first.
+        """
+        filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+        testing_libs = self.get_testing_libraries(testing_pro)
         
+        sim_projects, _ = self.read_neighbours(testing_pro)
+        
+        neighbour_ids = {}
         for key, project in sim_projects.items():
             filename = project.replace("git://github.com/", "").replace("/", "__")
-            tmp = os.path.join(self.src_dir, f"dicth_{filename}")
-            libs = self.reader.get_libraries(tmp)
-            all_neighbour_libs[key] = libs
-            libraries.update(libs)
+            neighbour_ids[key] = self.store.get_library_ids(filename)
+        
+        testing_ids = [self.store.get_library_id(lib) for lib in testing_libs]
+        user_item_matrix = UserItemMatrix.build(neighbour_ids, testing_ids, self.num_of_neighbours)
         
-        all_neighbour_libs[self.num_of_neighbours] = testing_libs
-        libraries.update(testing_libs)
+        libraries = [self.store.get_library(lib_id) for lib_id in user_item_matrix.library_ids.tolist()]
+        order = sorted(range(len(libraries)), key=libraries.__getitem__)
+        lib_set.extend(libraries[j] for j in order)
+        return user_item_matrix.reorder(np.array(order, dtype=np.int64))
+
+    def user_based_recommendation(self, workers: int = 1):
+        """
+        With workers > 1 the testing projects are split into chunks processed by
+        forked workers sharing the engine's read-only corpus store.
+        """
+        projects_file = os.path.join(self.src_dir, "projects.txt")
+        testing_projects = self.reader.read_project_list(projects_file, self.testing_start_pos, self.testing_end_pos)
+        self.splits.prepare(testing_projects.values())
+        results = map_sharded(self.recommend_user_based, list(testing_projects.values()), workers)
+        if self.fold_data is not None:
+            for testing_pro, recommendations in results:
+                self.fold_data.set_recommendations(testing_pro, recommendations)
+
+    def recommend_user_based(self, testing_pro: str) -> Tuple[str, List[Tuple[str, Any]]]:
+        recommendations = {}
+        similarities = {}
+        lib_set = []
+        
+        _, similarities = self.read_neighbours(testing_pro)
         
-        for lib in libraries:
-            lib_set.append(lib)
+        user_item_matrix = self.build_user_item_matrix(testing_pro, lib_set)
+        avg_rating = 1.0
+        val1 = sum(similarities.values())
         
-        num_rows = self.num_of_neighbours + 1
-        num_cols = len(libraries)
+        N = len(lib_set)
         
-        user_item_matrix = [[0.0 for _ in range(num_cols)] for _ in range(num_rows)]
+        # Neighbour means are computed once and every unseen library is predicted at once.
+        # Rows are accumulated in neighbour order so the sums match the scalar loop bit for bit.
+        unseen = user_item_matrix.unknown_columns()
+        if len(unseen) > 0:
+            neighbours = user_item_matrix.unpack()
+            tmp_rating = neighbours.sum(axis=1) / N
+            neighbours = neighbours[:, unseen]
+            val2 = np.zeros(len(unseen))
+            for k in range(self.num_of_neighbours):
+                val2 += (neighbours[k] - tmp_rating[k]) * similarities.get(k, 0.0)
+            scores = avg_rating + val2 / val1 if val1 != 0 else np.zeros(len(unseen))
+            recommendations = {str(j): score for j, score in zip(unseen.tolist(), scores.tolist())}
         
-        for i in range(self.num_of_neighbours):
-            tmp_libs = all_neighbour_libs.get(i, set())
-            for j in range(num_cols):
-                user_item_matrix[i][j] = 1.0 if lib_set[j] in tmp_libs else 0.0
+        sorted_recommendations = rank_scores(recommendations, self.top_k)
         
-        tmp_libs = all_neighbour_libs.get(self.num_of_neighbours, set())
-        for j in range(num_cols):
-            user_item_matrix[self.num_of_neighbours][j] = 1.0 if lib_set[j] in tmp_libs else -1.0
+        lines = []
+        if self.bayesian:
+            # The EASE topics used as query come first
+            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+            ease_topic = self.splits.get_query(filename)
+            ease_topic.pop(1, None)
+            lines.extend((v, 2) for v in ease_topic.values())
+        lines.extend((lib_set[int(key)], score) for key, score in sorted_recommendations)
         
-        return user_item_matrix
+        self.write_recommendations(testing_pro, lines)
+        return testing_pro, lines
 
-    def user_based_recommendation(self):
+    def predict_item_based(self, ratings: np.ndarray, sims: np.ndarray, avg_item_rating: np.ndarray) -> np.ndarray:
+        """
+        Predict every candidate from the ratings of the known libraries and the
+        (known x candidate) similarities; known libraries are accumulated in
+        column order, as in the per-pair loop.
+        """
+        tmp1 = np.zeros(sims.shape[1])
+        tmp2 = np.zeros(sims.shape[1])
+        for i, rating in enumerate(ratings.tolist()):
+            tmp1 += sims[i] * (rating - 1.0)
+            tmp2 += sims[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(tmp2 != 0, (tmp1 / tmp2) + avg_item_rating, avg_item_rating)
+
+    def new_item_based_recommendation(self):
         projects_file = os.path.join(self.src_dir, "projects.txt")
         testing_projects = self.reader.read_project_list(projects_file, self.testing_start_pos, self.testing_end_pos)
+        self.splits.prepare(testing_projects.values())
         
         for key_testing, testing_pro in testing_projects.items():
             recommendations = {}
-            similarities = {}
             lib_set = []
-            
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            tmp = os.path.join(self.sim_dir, filename)
-            similarities = self.reader.get_similarity_matrix(tmp, self.num_of_neighbours)
-            
             user_item_matrix = self.build_user_item_matrix(testing_pro, lib_set)
-            avg_rating = 1.0
-            val1 = sum(similarities.values())
-            
-            N = len(lib_set)
-            
-            for j in range(N):
-                if user_item_matrix[self.num_of_neighbours][j] == -1:
-                    val2 = 0.0
-                    for k in range(self.num_of_neighbours):
-                        tmp_rating = sum(user_item_matrix[k]) / N
-                        val2 += (user_item_matrix[k][j] - tmp_rating) * similarities.get(k, 0.0)
-                    
-                    recommendations[str(j)] = avg_rating + val2 / val1 if val1 != 0 else 0.0
             
-            sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+            candidates = user_item_matrix.unknown_columns()
+            known = user_item_matrix.known_columns()
             
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            tmp = os.path.join(self.rec_dir, filename)
+            if len(candidates) > 0:
+                v = user_item_matrix.column_counts()
+                count = v[candidates]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    avg_item_rating = np.where(count > 0, count / count, 0.0)
+                
+                v1 = user_item_matrix.co_occurrence(known, candidates)
+                denominator = np.sqrt(v[known])[:, None] + np.sqrt(v[candidates])[None, :]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    sims = np.where(denominator != 0, np.sqrt(v1) / denominator, 0.0)
+                
+                scores = self.predict_item_based(np.ones(len(known)), sims, avg_item_rating)
+                recommendations = {str(j): score for j, score in zip(candidates.tolist(), scores.tolist())}
             
-            try:
-                with open(tmp, 'w') as writer:
-                    if self.bayesian:
-                        ease_dict_file = os.path.join(self.src_dir, f"dicth_{filename}")
-                        ease_topic = self.reader.extract_EASE_dictionary(
-                            ease_dict_file, self.num_of_EASE_input, self.ground_truth)
-                        ease_topic.pop(1, None)
-                        for v in ease_topic.values():
-                            content = f"{v}\t2"
-                            writer.write(content + "\n")
-                    
-                    for key, score in sorted_recommendations:
-                        content = f"{lib_set[int(key)]}\t{score}"
-                        writer.write(content + "\n")
-            except IOError as e:
-                self.logger.error(f"Error writing recommendations to {tmp}: {e}")
+            sorted_recommendations = rank_scores(recommendations, self.top_k)
+            self.emit_recommendations(testing_pro, [(lib_set[int(key)], score) for key, score in sorted_recommendations])
 
-    def new_item_based_recommendation(self):
+    def item_based_recommendation(self):
         projects_file = os.path.join(self.src_dir, "projects.txt")
         testing_projects = self.reader.read_project_list(projects_file, self.testing_start_pos, self.testing_end_pos)
+        self.splits.prepare(testing_projects.values())
         
         for key_testing, testing_pro in testing_projects.items():
             recommendations = {}
             lib_set = []
             user_item_matrix = self.build_user_item_matrix(testing_pro, lib_set)
             
-            N = len(lib_set)
+            candidates = user_item_matrix.unknown_columns()
+            known = user_item_matrix.known_columns()
             
-            for j in range(N):
-                if user_item_matrix[self.num_of_neighbours][j] == -1:
-                    avg_item_rating = 0.0
-                    count = 0
-                    
-                    for l in range(self.num_of_neighbours):
-                        if user_item_matrix[l][j] != 0:
-                            avg_item_rating += user_item_matrix[l][j]
-                            count += 1
-                    
-                    avg_item_rating = avg_item_rating / count if count > 0 else 0.0
-                    
-                    tmp1 = 0.0
-                    tmp2 = 0.0
-                    
-                    for k in range(N):
-                        if k != j and user_item_matrix[self.num_of_neighbours][k] != -1:
-                            v1 = 0
-                            v2 = 0
-                            v3 = 0
-                            
-                            for l in range(self.num_of_neighbours):
-                                if user_item_matrix[l][k] == 1 and user_item_matrix[l][j] == 1:
-                                    v1 += 1
-                                if user_item_matrix[l][k] == 1:
-                                    v2 += 1
-                                if user_item_matrix[l][j] == 1:
-                                    v3 += 1
-                            
-                            sim = math.sqrt(v1) / (math.sqrt(v2) + math.sqrt(v3)) if (math.sqrt(v2) + math.sqrt(v3)) != 0 else 0.0
-                            
-                            tmp1 += sim * (user_item_matrix[self.num_of_neighbours][k] - 1.0)
-                            tmp2 += sim
-                    
-                    val = (tmp1 / tmp2) + avg_item_rating if tmp2 != 0 else avg_item_rating
-                    recommendations[str(j)] = val
+            if len(candidates) > 0:
+                v = user_item_matrix.column_counts()
+                avg_item_rating = v[candidates] / self.num_of_neighbours
+                
+                # Cosine of two binary columns: co-occurrences / sqrt(|k| * |j|), as in cosine_similarity()
+                sclar = user_item_matrix.co_occurrence(known, candidates)
+                norms = np.sqrt(v[known])[:, None] * np.sqrt(v[candidates])[None, :]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    sims = np.where((norms > 0) & (sclar > 0), sclar / np.sqrt(norms), 0.0)
+                
+                scores = self.predict_item_based(np.ones(len(known)), sims, avg_item_rating)
+                recommendations = {str(j): score for j, score in zip(candidates.tolist(), scores.tolist())}
             
-            sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
-            
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            tmp = os.path.join(self.rec_dir, filename)
-            
-            try:
-                with open(tmp, 'w') as writer:
-                    for key, score in sorted_recommendations:
-                        content = f"{lib_set[int(key)]}\t{score}"
-                        writer.write(content + "\n")
-            except IOError as e:
-                self.logger.error(f"Error writing recommendations to {tmp}: {e}")
+            sorted_recommendations = rank_scores(recommendations, self.top_k)
+            self.emit_recommendations(testing_pro, [(lib_set[int(key)], score) for key, score in sorted_recommendations])
 
-    def item_based_recommendation(self):
+    def index_item_based_recommendation(self, top_m: int = ItemSimilarityIndex.DEFAULT_TOP_M):
+        """
+        Item-based recommendation from the fold's precomputed item-item index:
+        every topic is scored by its similarities to the known topics of the
+        testing project, without building a neighbourhood.
+        """
         projects_file = os.path.join(self.src_dir, "projects.txt")
+        num_of_projects = self.reader.get_number_of_projects(projects_file)
         testing_projects = self.reader.read_project_list(projects_file, self.testing_start_pos, self.testing_end_pos)
+        self.splits.prepare(testing_projects.values())
+        
+        training_projects = {}
+        if self.testing_start_pos > 1:
+            training_projects.update(self.reader.read_project_list(projects_file, 1, self.testing_start_pos - 1))
+        if self.testing_end_pos < num_of_projects:
+            training_projects.update(self.reader.read_project_list(projects_file, self.testing_end_pos + 1, num_of_projects))
+        
+        training_filenames = [pro.replace("git://github.com/", "").replace("/", "__") for pro in training_projects.values()]
+        index = ItemSimilarityIndex.for_fold(self.store, self.item_index_dir, training_filenames, top_m,
+                                             projects_file)
         
         for key_testing, testing_pro in testing_projects.items():
-            recommendations = {}
-            lib_set = []
-            user_item_matrix = self.build_user_item_matrix(testing_pro, lib_set)
-            
-            N = len(lib_set)
-            
-            for j in range(N):
-                if user_item_matrix[self.num_of_neighbours][j] == -1:
-                    avg_item_rating = sum(row[j] for row in user_item_matrix[:self.num_of_neighbours]) / self.num_of_neighbours
-                    
-                    tmp1 = 0.0
-                    tmp2 = 0.0
-                    
-                    for k in range(N):
-                        if k != j and user_item_matrix[self.num_of_neighbours][k] != -1:
-                            vector1 = [row[k] for row in user_item_matrix[:self.num_of_neighbours]]
-                            vector2 = [row[j] for row in user_item_matrix[:self.num_of_neighbours]]
-                            sim = self.cosine_similarity(vector1, vector2)
-                            tmp1 += sim * (user_item_matrix[self.num_of_neighbours][k] - 1.0)
-                            tmp2 += sim
-                    
-                    val = (tmp1 / tmp2) + avg_item_rating if tmp2 != 0 else avg_item_rating
-                    recommendations[str(j)] = val
-            
-            sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
-            
-            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-            tmp = os.path.join(self.rec_dir, filename)
-            
-            try:
-                with open(tmp, 'w') as writer:
-                    for key, score in sorted_recommendations:
-                        content = f"{lib_set[int(key)]}\t{score}"
-                        writer.write(content + "\n")
-            except IOError as e:
-                self.logger.error(f"Error writing recommendations to {tmp}: {e}")
+            recommendations = index.score(self.get_testing_libraries(testing_pro))
+            self.emit_recommendations(testing_pro, rank_scores(recommendations, self.top_k))
 
     def cosine_similarity(self, vector1: List[float], vector2: List[float]) -> float:
         sclar = sum(v1 * v2 for v1, v2 in zip(vector1, vector2))
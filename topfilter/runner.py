@@ -7,10 +7,85 @@ from collections import defaultdict, OrderedDict
 from typing import Dict, List, Set, Tuple, Optional, Any, Union
 import heapq
 import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from data_reader import DataReader
 from topic_similarity_calculator import TopicSimilarityCalculator
 from recommendation_engine import RecommendationEngine
 from validator import Validator
+from split_manager import SplitManager
+from pipeline import FoldData, fold_step
+from metrics import Metrics
+
+def run_fold(src_dir: str, i: int, step: int, num_of_projects: int, num_of_neighbours: int,
+             bayesian: bool, binary_store: bool = False, in_memory: bool = False,
+             persist: bool = True) -> Dict[str, Any]:
+    """
+    Compute similarities and recommendations of fold i and report its status and timings.
+    With binary_store the similarities go through the fold's binary similarity store.
+    With in_memory the similarities, recommendations and ground truths are handed
+    between the stages as objects and the fold is evaluated right away, its scores
+    returned under "vals"; persist=False then skips writing the intermediate files.
+    """
+    logger = logging.getLogger(__name__)
+    training_start_pos1 = 1
+    training_end_pos1 = i * step
+    training_start_pos2 = (i + 1) * step + 1
+    training_end_pos2 = num_of_projects
+    testing_start_pos = 1 + i * step
+    testing_end_pos = (i + 1) * step
+
+    k = i + 1
+    sub_folder = f"Round{k}"
+    result = {"fold": i, "status": "ok", "similarity_time": 0.0, "recommendation_time": 0.0}
+    validator = Validator(src_dir, bayesian)
+    # Query/ground-truth split of the fold, shared by the similarity and recommendation stages
+    splits = SplitManager(src_dir, sub_folder, bayesian, persist=persist)
+    fold_data = FoldData(splits) if in_memory else None
+
+    try:
+        logger.info(f"Computing similarities fold {i}")
+        start = time.time()
+        calculator = TopicSimilarityCalculator(
+            src_dir, sub_folder,
+            training_start_pos1, training_end_pos1,
+            training_start_pos2, training_end_pos2,
+            testing_start_pos, testing_end_pos,
+            bayesian, splits=splits, binary_store=binary_store,
+            fold_data=fold_data, persist=persist, num_of_neighbours=num_of_neighbours
+        )
+
+        calculator.compute_weight_cosine_similarity()
+        result["similarity_time"] = time.time() - start
+        logger.info(f"\tComputed similarities fold {i}")
+
+        logger.info(f"Computing recommendations fold {i}")
+        start = time.time()
+        engine = RecommendationEngine(
+            src_dir, sub_folder, num_of_neighbours,
+            testing_start_pos, testing_end_pos, bayesian,
+            splits=splits, binary_store=binary_store,
+            fold_data=fold_data, persist=persist
+        )
+        engine.user_based_recommendation()
+        result["recommendation_time"] = time.time() - start
+        logger.info(f"\tComputed recommendations fold {i}")
+
+        if in_memory:
+            logger.info(f"Evaluating fold {i}")
+            metrics = Metrics(
+                k, validator.num_of_libraries, src_dir, sub_folder,
+                training_start_pos1, training_end_pos1,
+                training_start_pos2, training_end_pos2,
+                testing_start_pos, testing_end_pos,
+                fold_data=fold_data
+            )
+            result["tables"], result["vals"], result["recall_rate"] = validator.evaluate(metrics)
+    except Exception as e:
+        logger.error(f"Error in fold {i}: {e}")
+        result["status"] = f"failed: {e}"
+    return result
+
 
 class Runner:
     def __init__(self):
@@ -28,7 +103,8 @@ class Runner:
             self.logger.error(f"Error loading configurations from {self._prop_file}: {e}")
         return ""
 
-    def run(self, bayesian: bool):
+    def run(self, bayesian: bool, workers: int = 1, binary_store: bool = False, in_memory: bool = False,
+            persist: bool = True, folds: Optional[List[int]] = None):
         self.logger.info("TopFilter: Recommender System!")
         
         self.src_dir = "/home/shayan/projects/github-recommender/dataset/topfilter/D1/"
@@ -37,55 +113,82 @@ class Runner:
         projects_file = os.path.join(self.src_dir, "projects.txt")
         num_of_projects = dr.get_number_of_projects(projects_file)
         
-        self.ten_fold_cross_validation(bayesian, num_of_projects)
+        results = self.ten_fold_cross_validation(bayesian, num_of_projects, workers, binary_store,
+                                                 in_memory, persist, folds)
         self.logger.info(f"Current time: {int(time.time() * 1000)}")
 
         validator = Validator(self.src_dir, bayesian)
-        validator.run()
+        if in_memory:
+            # The folds were evaluated in memory, only their Results are left to write
+            validator.merge_results([result for result in results if "tables" in result])
+        else:
+            validator.run(workers, [result["fold"] for result in results if result["status"] == "ok"])
         self.logger.info(f"Neighbor: {self.num_of_neighbours}")
         self.logger.info(f"Dataset: {self.src_dir}")
 
-    def ten_fold_cross_validation(self, bayesian: bool, num_of_projects: int):
-        step = math.ceil(num_of_projects / 10)
-        
-        for i in range(10):
-            training_start_pos1 = 1
-            training_end_pos1 = i * step
-            training_start_pos2 = (i + 1) * step + 1
-            training_end_pos2 = num_of_projects
-            testing_start_pos = 1 + i * step
-            testing_end_pos = (i + 1) * step
-            
-            k = i + 1
-            sub_folder = f"Round{k}"
-            
-            self.logger.info(f"Computing similarities fold {i}")
-            
-            calculator = TopicSimilarityCalculator(
-                self.src_dir, sub_folder,
-                training_start_pos1, training_end_pos1,
-                training_start_pos2, training_end_pos2,
-                testing_start_pos, testing_end_pos,
-                bayesian
-            )
-            
-            calculator.compute_weight_cosine_similarity()
-            self.logger.info(f"\tComputed similarities fold {i}")
-            
-            self.logger.info(f"Computing recommendations fold {i}")
-            engine = RecommendationEngine(
-                self.src_dir, sub_folder, self.num_of_neighbours,
-                testing_start_pos, testing_end_pos, bayesian
-            )
-            engine.user_based_recommendation()
-            self.logger.info(f"\tComputed recommendations fold {i}")
-            break
+    def ten_fold_cross_validation(self, bayesian: bool, num_of_projects: int, workers: int = 1,
+                                  binary_store: bool = False, in_memory: bool = False,
+                                  persist: bool = True, folds: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Compute the given folds, all ten by default, one after the other or on workers processes.
+        """
+        step = fold_step(num_of_projects)
+        folds = list(range(10)) if folds is None else folds
+
+        if workers > 1:
+            return self.parallel_cross_validation(bayesian, num_of_projects, step, workers, binary_store,
+                                                  in_memory, persist, folds)
+
+        results = []
+        for i in folds:
+            results.append(run_fold(self.src_dir, i, step, num_of_projects, self.num_of_neighbours, bayesian,
+                                    binary_store, in_memory, persist))
+        return results
+
+    def parallel_cross_validation(self, bayesian: bool, num_of_projects: int, step: int, workers: int,
+                                  binary_store: bool = False, in_memory: bool = False,
+                                  persist: bool = True, folds: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Run the independent folds on a process pool; each fold writes to its own RoundN folder.
+        """
+        folds = list(range(10)) if folds is None else folds
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_fold, self.src_dir, i, step, num_of_projects,
+                                       self.num_of_neighbours, bayesian, binary_store, in_memory, persist)
+                       for i in folds]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                self.logger.info(f"Fold {result['fold']} finished: {result['status']}")
+
+        for result in sorted(results, key=lambda r: r["fold"]):
+            self.logger.info(f"Fold {result['fold']}: {result['status']}, "
+                             f"similarities {result['similarity_time']:.2f}s, "
+                             f"recommendations {result['recommendation_time']:.2f}s")
+        return sorted(results, key=lambda r: r["fold"])
 
     @staticmethod
     def main():
+        parser = argparse.ArgumentParser(description="TopFilter ten-fold cross validation")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="number of folds computed in parallel")
+        parser.add_argument("--binary-similarities", action="store_true",
+                            help="keep similarities in a binary store per fold instead of TSV files")
+        parser.add_argument("--in-memory", action="store_true",
+                            help="pass similarities, recommendations and ground truths between stages in memory")
+        parser.add_argument("--no-persist", action="store_true",
+                            help="with --in-memory, do not write the intermediate Similarities/, "
+                                 "Recommendations/ and GroundTruth/ files")
+        parser.add_argument("--fold", type=int, action="append", choices=range(10),
+                            help="only compute this fold (0-9), e.g. for a quick debug run; "
+                                 "may be repeated, all ten folds by default")
+        args = parser.parse_args()
+
         runner = Runner()
         try:
-            runner.run(True)
+            runner.run(True, args.workers, args.binary_similarities, args.in_memory,
+                       not (args.in_memory and args.no_persist), args.fold)
         except Exception as e:
             runner.logger.error(f"Error in main execution: {e}")
 
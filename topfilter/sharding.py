@@ -0,0 +1,45 @@
+import multiprocessing
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+# Task of the running map_sharded() call, inherited by the forked workers
+_task: Optional[Callable[[Any], Any]] = None
+
+
+def _run_chunk(chunk: Sequence[Any]) -> List[Any]:
+    return [_task(item) for item in chunk]
+
+
+def map_sharded(task: Callable[[Any], Any], items: Sequence[Any], workers: int = 1) -> List[Any]:
+    """
+    Apply task to every item, splitting the items into contiguous chunks run by
+    forked worker processes. The task and the read-only structures it refers to
+    are shared with the workers through fork copy-on-write instead of being
+    pickled; only the items and the results cross process boundaries.
+    Falls back to a sequential loop when fork is unavailable.
+    """
+    return list(imap_sharded(task, items, workers))
+
+
+def imap_sharded(task: Callable[[Any], Any], items: Sequence[Any], workers: int = 1) -> Iterator[Any]:
+    """
+    Lazy map_sharded: yield the results in item order as the chunks complete,
+    so the caller only holds the results of the chunks it has not consumed yet.
+    """
+    global _task
+    items = list(items)
+    if workers <= 1 or len(items) < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        for item in items:
+            yield task(item)
+        return
+
+    num_chunks = min(len(items), workers * 4)
+    size = -(-len(items) // num_chunks)
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+
+    _task = task
+    try:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            for chunk in pool.imap(_run_chunk, chunks):
+                yield from chunk
+    finally:
+        _task = None
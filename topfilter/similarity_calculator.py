@@ -5,6 +5,9 @@ from pathlib import Path
 from typing import Dict, List, Set, Tuple, Optional, Any, Union
 from collections import defaultdict, OrderedDict
 import heapq
+from corpus_store import CorpusStore
+from ranking import rank_scores
+from split_manager import SplitManager
 
 class SimilarityCalculator:
     """
@@ -12,7 +15,9 @@ class SimilarityCalculator:
     """
     
     def __init__(self, source_dir: str, sub_folder: str, tr_start_pos1: int, tr_end_pos1: int,
-                 tr_start_pos2: int, tr_end_pos2: int, te_start_pos: int, te_end_pos: int, bayesian: bool):
+                 tr_start_pos2: int, tr_end_pos2: int, te_start_pos: int, te_end_pos: int, bayesian: bool,
+                 store: Optional[CorpusStore] = None, top_k: Optional[int] = None,
+                 splits: Optional[SplitManager] = None):
         self.src_dir = source_dir
         self.sub_folder = sub_folder
         self.ground_truth = str(Path(self.src_dir) / self.sub_folder / "GroundTruth")
@@ -26,6 +31,9 @@ class SimilarityCalculator:
         self.testing_end_pos = te_end_pos
         self.bayesian = bayesian
         self.num_of_EASE_input = 5
+        self.store = store or CorpusStore.for_dataset(source_dir)
+        self.top_k = top_k
+        self.splits = splits or SplitManager(source_dir, sub_folder, bayesian, self.num_of_EASE_input)
         self.logger = logging.getLogger(__name__)
 
     def compute_weight_cosine_similarity(self):
@@ -35,6 +43,7 @@ class SimilarityCalculator:
         """
         from data_reader import DataReader
         from graph import Graph
+        from library_index import LibraryIndex
         
         reader = DataReader(self.src_dir)
         training_projects = {}
@@ -57,56 +66,48 @@ class SimilarityCalculator:
             projects_file, self.testing_start_pos, self.testing_end_pos)
         
         # Initialize graph and dictionaries
-        graph = None
+        graph = Graph()
         all_training_libs = set()
         training_dictionaries = {}
+        library_index = LibraryIndex()
         
         # Process training projects
         for key_training, training_pro in training_projects.items():
             training_filename = training_pro.replace("git://github.com/", "").replace("/", "__")
-            training_graph_file = str(Path(self.src_dir) / f"graph_{training_filename}")
-            training_dict_file = str(Path(self.src_dir) / f"dicth_{training_filename}")
             
-            training_libs = reader.get_libraries(training_dict_file)
+            training_libs = self.store.get_libraries(training_filename)
             all_training_libs.update(training_libs)
+            library_index.add(key_training, training_libs)
             
-            training_dict = reader.read_dictionary(training_dict_file)
+            training_dict = self.store.read_dictionary(training_filename)
             training_dictionaries[key_training] = training_dict
-            training_graph = Graph(training_graph_file, training_dict)
+            training_graph = self.store.get_graph(training_filename, training_dict)
             
-            if graph is None:
-                graph = Graph()
-                graph.OutLinks = training_graph.OutLinks.copy()
-                graph.dictionary = training_graph.dictionary.copy()
-                graph.nodeCount = training_graph.nodeCount
-            else:
-                graph.combine(training_graph, training_dict)
+            graph.combine(training_graph, training_dict)
         
         get_also_users = False
+        self.splits.prepare(testing_projects.values(), get_also_users)
         
         # Process testing projects
         for key_testing, testing_pro in testing_projects.items():
             try:
                 all_libs = set(all_training_libs)
                 combined_graph = Graph()
-                combined_graph.OutLinks = graph.OutLinks.copy()
+                # Copy the out-link sets too, combine() adds the testing project's edges to them
+                combined_graph.OutLinks = defaultdict(set, {node: set(links) for node, links in graph.OutLinks.items()})
                 combined_graph.dictionary = graph.dictionary.copy()
                 combined_graph.nodeCount = graph.nodeCount
                 
-                sim = {}
+                sim = dict.fromkeys((str(key) for key in training_projects), 0.0)
                 filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-                testing_graph_file = str(Path(self.src_dir) / f"graph_{filename}")
-                testing_dict_file = str(Path(self.src_dir) / f"dicth_{filename}")
                 
-                # Get testing dictionary based on bayesian flag
-                testing_dict = (reader.extract_EASE_dictionary(testing_dict_file, self.num_of_EASE_input, self.ground_truth) 
-                              if self.bayesian 
-                              else reader.extract_half_dictionary(testing_dict_file, self.ground_truth, get_also_users))
+                # Query of the testing project, split according to the bayesian flag
+                testing_dict = self.splits.get_query(filename, get_also_users)
                 
                 testing_libs = {v for v in testing_dict.values() if v.startswith("#DEP#")}
                 all_libs.update(testing_libs)
                 
-                testing_graph = Graph(testing_graph_file, testing_dict)
+                testing_graph = self.store.get_graph(filename, testing_dict)
                 combined_graph.combine(testing_graph, testing_dict)
                 
                 # Calculate library weights using IDF
@@ -124,11 +125,13 @@ class SimilarityCalculator:
                     lib_weight[lib_id] = idf
                 
                 # Calculate similarity with each training project
-                for key_training, training_pro in training_projects.items():
-                    training_filename = training_pro.replace("git://github.com/", "").replace("/", "__")
-                    training_dict_file = str(Path(self.src_dir) / f"dicth_{training_filename}")
-                    training_libs = reader.get_libraries(training_dict_file)
-                    
+                # Training projects sharing no topic with the testing project keep similarity 0
+                candidates = library_index.candidates(testing_libs)
+                for key_training in training_projects:
+                    if key_training not in candidates:
+                        continue
+                    training_libs = library_index.get_libraries(key_training)
+
                     union = testing_libs.union(training_libs)
                     lib_set = list(union)
                     
@@ -155,7 +158,7 @@ class SimilarityCalculator:
                     sim[str(key_training)] = val
                 
                 # Sort similarities and write to file
-                sorted_sim = sorted(sim.items(), key=lambda x: x[1], reverse=True)
+                sorted_sim = rank_scores(sim, self.top_k)
                 output_file = str(Path(self.sim_dir) / filename)
                 
                 with open(output_file, 'w') as writer:
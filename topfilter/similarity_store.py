@@ -0,0 +1,139 @@
+import os
+import mmap
+import struct
+import logging
+import argparse
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from project_list_index import ProjectListIndex
+
+
+class SimilarityStore:
+    """
+    Binary similarities of a fold: for every testing project, its ranked
+    training neighbours as fixed-width (neighbour id, float32 score) records.
+    Project ids are line numbers of projects.txt. Layout, little endian:
+
+        header   magic, number of testing projects
+        index    (testing id int64, first record int64, number of records int64) per project, sorted by id
+        records  (neighbour id int32, score float32)
+    """
+
+    FILENAME = "Similarities.bin"
+    MAGIC = b"TFSIM001"
+    HEADER = struct.Struct("<8sq")
+    INDEX_DTYPE = np.dtype([("id", "<i8"), ("start", "<i8"), ("count", "<i8")])
+    RECORD_DTYPE = np.dtype([("neighbour", "<i4"), ("score", "<f4")])
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.logger = logging.getLogger(__name__)
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_testing = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            raise IOError(f"{filename} is not a similarity store")
+        self.index = np.frombuffer(self._mmap, dtype=self.INDEX_DTYPE, count=num_testing, offset=self.HEADER.size)
+        self.records = np.frombuffer(self._mmap, dtype=self.RECORD_DTYPE,
+                                     offset=self.HEADER.size + self.index.nbytes)
+
+    @classmethod
+    def open(cls, filename: str) -> Optional['SimilarityStore']:
+        try:
+            return cls(filename)
+        except (IOError, ValueError, struct.error) as e:
+            logging.getLogger(__name__).error(f"Error opening similarity store {filename}: {e}")
+            return None
+
+    @classmethod
+    def write(cls, filename: str, similarities: Dict[int, Tuple[np.ndarray, np.ndarray]]):
+        """
+        Write the ranked (neighbour ids, scores) of every testing id.
+        """
+        writer = SimilarityStoreWriter(filename, similarities)
+        try:
+            for testing_id in sorted(similarities):
+                writer.add(testing_id, *similarities[testing_id])
+        finally:
+            writer.close()
+
+    def testing_ids(self) -> np.ndarray:
+        return self.index["id"]
+
+    def get(self, testing_id: int, size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Neighbour ids and scores of a testing project, best first, at most size of them.
+        """
+        row = np.searchsorted(self.index["id"], testing_id)
+        if row == len(self.index) or self.index["id"][row] != testing_id:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        start, count = int(self.index["start"][row]), int(self.index["count"][row])
+        if size is not None:
+            count = min(count, size)
+        records = self.records[start:start + count]
+        return records["neighbour"], records["score"]
+
+
+class SimilarityStoreWriter:
+    """
+    Streams the rankings of a fold into a similarity store. The index has an
+    entry for every given testing id, filled in on close; records are appended
+    as the rankings are added, so only one ranking is held at a time. Testing
+    ids never added are left without neighbours.
+    """
+
+    def __init__(self, filename: str, testing_ids: Iterable[int]):
+        ids = sorted(set(testing_ids))
+        self.index = np.zeros(len(ids), dtype=SimilarityStore.INDEX_DTYPE)
+        self.index["id"] = ids
+        self.rows = {testing_id: row for row, testing_id in enumerate(ids)}
+        self.num_records = 0
+        self._writer = open(filename, 'wb')
+        self._writer.write(SimilarityStore.HEADER.pack(SimilarityStore.MAGIC, len(ids)))
+        # Placeholder for the index
+        self._writer.write(self.index.tobytes())
+
+    def add(self, testing_id: int, neighbours: np.ndarray, scores: np.ndarray):
+        records = np.zeros(len(neighbours), dtype=SimilarityStore.RECORD_DTYPE)
+        records["neighbour"] = neighbours
+        records["score"] = scores
+        self.index[self.rows[testing_id]] = (testing_id, self.num_records, len(records))
+        self._writer.write(records.tobytes())
+        self.num_records += len(records)
+
+    def close(self):
+        if self._writer.closed:
+            return
+        self._writer.seek(SimilarityStore.HEADER.size)
+        self._writer.write(self.index.tobytes())
+        self._writer.close()
+
+
+def export_tsv(store_file: str, projects_file: str, out_dir: str):
+    """
+    Write the store as the Similarities/ TSV files: testing URI, neighbour URI and score per line.
+    """
+    logger = logging.getLogger(__name__)
+    store = SimilarityStore(store_file)
+    names = ProjectListIndex.for_file(projects_file).all_names()
+    os.makedirs(out_dir, exist_ok=True)
+    for testing_id in store.testing_ids().tolist():
+        testing_pro = names[testing_id - 1]
+        filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+        neighbours, scores = store.get(testing_id)
+        try:
+            with open(os.path.join(out_dir, filename), 'w') as writer:
+                for neighbour, score in zip(neighbours.tolist(), scores.tolist()):
+                    writer.write(f"{testing_pro}\t{names[neighbour - 1]}\t{score}\n")
+        except IOError as e:
+            logger.error(f"Error exporting similarities of {testing_pro}: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export a binary similarity store as TSV files")
+    parser.add_argument("store", help="RoundN/Similarities.bin file")
+    parser.add_argument("projects", help="projects.txt of the dataset")
+    parser.add_argument("out_dir", help="folder receiving one TSV file per testing project")
+    args = parser.parse_args()
+    export_tsv(args.store, args.projects, args.out_dir)
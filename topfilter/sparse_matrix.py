@@ -1,50 +1,148 @@
-import os
-import math
 import logging
-from pathlib import Path
-from collections import defaultdict, OrderedDict
-from typing import Dict, List, Set, Tuple, Optional, Any, Union
-import heapq
-import csv
+from typing import Dict, Iterable, Optional, Tuple, Union
+import numpy as np
+from scipy import sparse
+from sparse_vector import SparseVector
+
 
 class SparseMatrix:
-    def __init__(self, N: int):
+    """
+    Sparse N x M matrix (square by default) stored as contiguous CSR arrays.
+    Single-entry writes through put() are staged and merged into the CSR
+    arrays in one vectorized step the next time the matrix is read.
+    """
+
+    def __init__(self, N: int, M: Optional[int] = None):
         self.N = N
-        self.cols = [SparseVector(N) for _ in range(N)]
+        self.M = N if M is None else M
+        self._matrix = sparse.csr_matrix((self.N, self.M), dtype=np.float64)
+        self._pending: Dict[Tuple[int, int], float] = {}
+        self.logger = logging.getLogger(__name__)
 
-    def put(self, i: int, j: int, value: float):
-        if i < 0 or i >= self.N or j < 0 or j >= self.N:
+    @classmethod
+    def from_scipy(cls, matrix) -> 'SparseMatrix':
+        """
+        Wrap a SciPy sparse matrix; CSR and CSC inputs are kept without copying.
+        """
+        if not sparse.isspmatrix_csr(matrix) and not sparse.isspmatrix_csc(matrix):
+            matrix = sparse.csr_matrix(matrix)
+        A = cls(matrix.shape[0], matrix.shape[1])
+        A._matrix = matrix
+        return A
+
+    @classmethod
+    def from_triplets(cls, rows: Iterable[int], cols: Iterable[int], values: Iterable[float],
+                      shape: Tuple[int, int]) -> 'SparseMatrix':
+        """
+        Build a matrix from (row, col, value) triplets; duplicate entries are summed.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        matrix = sparse.csr_matrix((values, (rows, cols)), shape=shape)
+        matrix.sum_duplicates()
+        matrix.eliminate_zeros()
+        return cls.from_scipy(matrix)
+
+    @classmethod
+    def load(cls, filename: str) -> 'SparseMatrix':
+        return cls.from_scipy(sparse.load_npz(filename))
+
+    def save(self, filename: str):
+        sparse.save_npz(filename, self.to_scipy())
+
+    def to_scipy(self):
+        """
+        Return the underlying SciPy matrix (CSR, or CSC for a transposed view).
+        """
+        if self._pending:
+            self._flush()
+        return self._matrix
+
+    def _flush(self):
+        keys = np.array(list(self._pending.keys()), dtype=np.int64)
+        values = np.fromiter(self._pending.values(), dtype=np.float64, count=len(self._pending))
+        self._pending = {}
+        shape = (self.N, self.M)
+        ones = np.ones(len(values), dtype=np.float64)
+        mask = sparse.csr_matrix((ones, (keys[:, 0], keys[:, 1])), shape=shape)
+        staged = sparse.csr_matrix((values, (keys[:, 0], keys[:, 1])), shape=shape)
+        matrix = self._matrix.tocsr()
+        matrix = matrix - matrix.multiply(mask) + staged
+        matrix.eliminate_zeros()
+        self._matrix = sparse.csr_matrix(matrix)
+
+    def _check_index(self, i: int, j: int):
+        if i < 0 or i >= self.N or j < 0 or j >= self.M:
             raise ValueError("Illegal index")
-        self.cols[i].put(j, value)
+
+    def put(self, i: int, j: int, value: float):
+        self._check_index(i, j)
+        self._pending[(i, j)] = value
 
     def get(self, i: int, j: int) -> float:
-        if i < 0 or i >= self.N or j < 0 or j >= self.N:
-            raise ValueError("Illegal index")
-        return self.cols[i].get(j)
+        self._check_index(i, j)
+        if (i, j) in self._pending:
+            return self._pending[(i, j)]
+        return float(self._matrix[i, j])
 
     def nnz(self) -> int:
-        return sum(col.nnz() for col in self.cols)
+        return self.to_scipy().nnz
+
+    def shape(self) -> Tuple[int, int]:
+        return self.N, self.M
+
+    def times(self, x: Union[SparseVector, np.ndarray]) -> Union[SparseVector, np.ndarray]:
+        """
+        Matrix-vector product. A SparseVector argument gives a SparseVector
+        result, a NumPy array gives a NumPy array.
+        """
+        if isinstance(x, SparseVector):
+            if self.M != x.size():
+                raise ValueError("Dimensions disagree")
+            vector = sparse.csr_matrix(
+                (np.frombuffer(x.values, dtype=np.float64),
+                 np.frombuffer(x.indices, dtype=np.int32),
+                 np.array([0, x.nnz()], dtype=np.int32)),
+                shape=(1, self.M))
+            product = (self.to_scipy() @ vector.T).tocoo()
+            return SparseVector.from_pairs(self.N, zip(product.row.tolist(), product.data.tolist()))
 
-    def times(self, x: SparseVector) -> SparseVector:
-        if self.N != x.size():
+        x = np.asarray(x, dtype=np.float64)
+        if x.shape[0] != self.M:
             raise ValueError("Dimensions disagree")
-        b = SparseVector(self.N)
-        for i in range(self.N):
-            b.put(i, self.cols[i].dot(x))
-        return b
+        return self.to_scipy() @ x
+
+    def times_matrix(self, B: 'SparseMatrix') -> 'SparseMatrix':
+        if self.M != B.N:
+            raise ValueError("Dimensions disagree")
+        return SparseMatrix.from_scipy(sparse.csr_matrix(self.to_scipy() @ B.to_scipy()))
 
     def plus(self, B: 'SparseMatrix') -> 'SparseMatrix':
-        if self.N != B.N:
+        if self.N != B.N or self.M != B.M:
             raise ValueError("Dimensions disagree")
-        C = SparseMatrix(self.N)
-        for i in range(self.N):
-            C.cols[i] = self.cols[i].plus(B.cols[i])
-        return C
+        return SparseMatrix.from_scipy(sparse.csr_matrix(self.to_scipy() + B.to_scipy()))
+
+    def transpose(self) -> 'SparseMatrix':
+        """
+        Transposed view sharing the same arrays (a CSR matrix becomes CSC).
+        """
+        return SparseMatrix.from_scipy(self.to_scipy().T)
+
+    def row_norms(self) -> np.ndarray:
+        matrix = self.to_scipy()
+        return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+
+    def scale_rows(self, factors: np.ndarray) -> 'SparseMatrix':
+        return SparseMatrix.from_scipy(sparse.csr_matrix(sparse.diags(factors) @ self.to_scipy()))
 
     def __str__(self) -> str:
-        s = f"N = {self.N}, nonzeros = {self.nnz()}\n"
+        matrix = self.to_scipy().tocsr()
+        s = f"N = {self.N}, nonzeros = {matrix.nnz}\n"
         for i in range(self.N):
-            s += f"{i}: {self.cols[i]}\n"
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            row = " ".join(f"({j}, {val})" for j, val in zip(matrix.indices[start:end], matrix.data[start:end]))
+            s += f"{i}: {row}\n"
         return s
 
     def test(self):
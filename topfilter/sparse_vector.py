@@ -1,35 +1,86 @@
-import os
 import math
-import logging
-from pathlib import Path
-from collections import defaultdict, OrderedDict
-from typing import Dict, List, Set, Tuple, Optional, Any, Union
-import heapq
-import csv
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
 
 class SparseVector:
+    """
+    Sparse vector of size N stored as parallel sorted arrays of indices and
+    non-zero values. Dot products are computed with a merge join over the two
+    index arrays and the norm is cached until the vector is modified.
+    """
+    __slots__ = ("N", "indices", "values", "_norm")
+
     def __init__(self, N: int):
         self.N = N
-        self.st = {}  # Using dict instead of ST class for simplicity
+        self.indices = array('i')
+        self.values = array('d')
+        self._norm: Optional[float] = None
+
+    @classmethod
+    def from_pairs(cls, N: int, pairs: Iterable[Tuple[int, float]]) -> 'SparseVector':
+        """
+        Build a vector from (index, value) pairs; a later pair overrides an earlier one.
+        """
+        entries = {}
+        for i, value in pairs:
+            if i < 0 or i >= N:
+                raise ValueError(f"Illegal index {i} for vector size {N}")
+            entries[i] = value
+        v = cls(N)
+        for i in sorted(entries):
+            value = entries[i]
+            if value != 0.0:
+                v.indices.append(i)
+                v.values.append(value)
+        return v
+
+    @classmethod
+    def from_dict(cls, N: int, entries: Dict[int, float]) -> 'SparseVector':
+        return cls.from_pairs(N, entries.items())
+
+    @classmethod
+    def from_dense(cls, values: Iterable[float]) -> 'SparseVector':
+        values = list(values)
+        return cls.from_pairs(len(values), ((i, v) for i, v in enumerate(values) if v != 0.0))
 
     def reset(self):
-        self.st = {}
+        self.indices = array('i')
+        self.values = array('d')
+        self._norm = None
 
-    def put(self, i: int, value: float):
+    def _check_index(self, i: int):
         if i < 0 or i >= self.N:
             raise ValueError(f"Illegal index {i} for vector size {self.N}")
+
+    def put(self, i: int, value: float):
+        self._check_index(i)
+        pos = bisect_left(self.indices, i)
+        found = pos < len(self.indices) and self.indices[pos] == i
         if value == 0.0:
-            self.st.pop(i, None)
+            if found:
+                del self.indices[pos]
+                del self.values[pos]
+        elif found:
+            self.values[pos] = value
         else:
-            self.st[i] = value
+            self.indices.insert(pos, i)
+            self.values.insert(pos, value)
+        self._norm = None
 
     def get(self, i: int) -> float:
-        if i < 0 or i >= self.N:
-            raise ValueError(f"Illegal index {i} for vector size {self.N}")
-        return self.st.get(i, 0.0)
+        self._check_index(i)
+        pos = bisect_left(self.indices, i)
+        if pos < len(self.indices) and self.indices[pos] == i:
+            return self.values[pos]
+        return 0.0
+
+    def items(self) -> Iterator[Tuple[int, float]]:
+        return zip(self.indices, self.values)
 
     def nnz(self) -> int:
-        return len(self.st)
+        return len(self.indices)
 
     def size(self) -> int:
         return self.N
@@ -37,61 +88,102 @@ class SparseVector:
     def dot(self, b: 'SparseVector') -> float:
         if self.N != b.N:
             raise ValueError("Vector lengths disagree")
-        
+
+        idx_a, val_a = self.indices, self.values
+        idx_b, val_b = b.indices, b.values
+        len_a, len_b = len(idx_a), len(idx_b)
         sum_val = 0.0
-        if len(self.st) <= len(b.st):
-            for i in self.st:
-                if i in b.st:
-                    sum_val += self.get(i) * b.get(i)
-        else:
-            for i in b.st:
-                if i in self.st:
-                    sum_val += self.get(i) * b.get(i)
+        p = q = 0
+        while p < len_a and q < len_b:
+            i, j = idx_a[p], idx_b[q]
+            if i == j:
+                sum_val += val_a[p] * val_b[q]
+                p += 1
+                q += 1
+            elif i < j:
+                p += 1
+            else:
+                q += 1
         return sum_val
 
     def norm(self) -> float:
-        return math.sqrt(self.dot(self))
+        if self._norm is None:
+            self._norm = math.sqrt(sum(v * v for v in self.values))
+        return self._norm
 
     def scale(self, alpha: float) -> 'SparseVector':
+        c = self.copy()
+        c.iscale(alpha)
+        return c
+
+    def iscale(self, alpha: float) -> 'SparseVector':
+        """
+        Multiply the vector by alpha in place.
+        """
+        if alpha == 0.0:
+            self.reset()
+            return self
+        values = self.values
+        for p in range(len(values)):
+            values[p] *= alpha
+        self._norm = None
+        return self
+
+    def axpy(self, alpha: float, x: 'SparseVector') -> 'SparseVector':
+        """
+        Replace the vector with alpha * x + self in place.
+        """
+        if self.N != x.N:
+            raise ValueError("Vector lengths disagree")
+
+        idx_a, val_a = self.indices, self.values
+        idx_b, val_b = x.indices, x.values
+        len_a, len_b = len(idx_a), len(idx_b)
+        indices = array('i')
+        values = array('d')
+        p = q = 0
+        while p < len_a or q < len_b:
+            if q >= len_b or (p < len_a and idx_a[p] < idx_b[q]):
+                i, value = idx_a[p], val_a[p]
+                p += 1
+            elif p >= len_a or idx_b[q] < idx_a[p]:
+                i, value = idx_b[q], alpha * val_b[q]
+                q += 1
+            else:
+                i, value = idx_a[p], val_a[p] + alpha * val_b[q]
+                p += 1
+                q += 1
+            if value != 0.0:
+                indices.append(i)
+                values.append(value)
+        self.indices = indices
+        self.values = values
+        self._norm = None
+        return self
+
+    def copy(self) -> 'SparseVector':
         c = SparseVector(self.N)
-        for i in self.st:
-            c.put(i, alpha * self.get(i))
+        c.indices = array('i', self.indices)
+        c.values = array('d', self.values)
+        c._norm = self._norm
         return c
 
     def cosine_similarity(self, b: 'SparseVector') -> float:
         if self.N != b.N:
             raise ValueError("Vector lengths disagree")
-        
-        sum_val = 0.0
-        val1 = sum(v * v for v in self.st.values())
-        val2 = sum(v * v for v in b.st.values())
-        
-        if len(self.st) <= len(b.st):
-            for i in self.st:
-                if i in b.st:
-                    sum_val += self.get(i) * b.get(i)
-        else:
-            for i in b.st:
-                if i in self.st:
-                    sum_val += self.get(i) * b.get(i)
-        
+
+        sum_val = self.dot(b)
         if sum_val == 0:
             return 0.0
-        return sum_val / math.sqrt(val1 * val2)
+        return sum_val / (self.norm() * b.norm())
 
     def plus(self, b: 'SparseVector') -> 'SparseVector':
         if self.N != b.N:
             raise ValueError("Vector lengths disagree")
-        
-        c = SparseVector(self.N)
-        for i in self.st:
-            c.put(i, self.get(i))
-        for i in b.st:
-            c.put(i, b.get(i) + c.get(i))
-        return c
+        return self.copy().axpy(1.0, b)
 
     def __str__(self) -> str:
-        return " ".join(f"({i}, {val})" for i, val in self.st.items())
+        return " ".join(f"({i}, {val})" for i, val in self.items())
 
     def test(self):
         a = SparseVector(10)
@@ -106,4 +198,3 @@ class SparseVector:
         print(f"b = {b}")
         print(f"a dot b = {a.dot(b)}")
         print(f"a + b = {a.plus(b)}")
-
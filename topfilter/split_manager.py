@@ -0,0 +1,71 @@
+import os
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from data_reader import DataReader
+
+
+class SplitManager:
+    """
+    Query/ground-truth split of the testing projects of a fold. Each project
+    is split once; the ground-truth files of a batch of projects are written
+    together and later stages are served the query from memory. With
+    persist=False the ground truths are only kept in memory.
+    """
+
+    def __init__(self, source_dir: str, sub_folder: str, bayesian: bool, num_of_EASE_input: int = 5,
+                 reader: Optional[DataReader] = None, persist: bool = True):
+        self.src_dir = source_dir
+        self.sub_folder = sub_folder
+        self.bayesian = bayesian
+        self.num_of_EASE_input = num_of_EASE_input
+        self.persist = persist
+        self.ground_truth = os.path.join(self.src_dir, sub_folder, "GroundTruth")
+        self.reader = reader or DataReader(source_dir)
+        # (project file stem, get_also_users) -> query dictionary
+        self.queries: Dict[Tuple[str, bool], Dict[int, str]] = {}
+        self.ground_truths: Dict[str, List[Tuple[int, str]]] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def _split(self, filename: str, get_also_users: bool) -> List[str]:
+        dict_file = os.path.join(self.src_dir, f"dicth_{filename}")
+        if self.bayesian:
+            query, ground_truth = self.reader.split_EASE_dictionary(dict_file, self.num_of_EASE_input)
+        else:
+            query, ground_truth = self.reader.split_half_dictionary(dict_file, get_also_users)
+        self.queries[(filename, get_also_users)] = query
+        if filename in self.ground_truths or not self.reader.has_dictionary(dict_file):
+            return []
+        self.ground_truths[filename] = ground_truth
+        return [filename]
+
+    def prepare(self, projects: Iterable[str], get_also_users: bool = False):
+        """
+        Split every given project not split yet and write their ground truths in one batch.
+        """
+        pending = []
+        for project in projects:
+            filename = project.replace("git://github.com/", "").replace("/", "__")
+            if (filename, get_also_users) not in self.queries:
+                pending.extend(self._split(filename, get_also_users))
+        self.write_ground_truths(pending)
+
+    def write_ground_truths(self, filenames: List[str]):
+        if not self.persist:
+            return
+        for filename in filenames:
+            dict_file = os.path.join(self.src_dir, f"dicth_{filename}")
+            self.reader.write_ground_truth(dict_file, self.ground_truth, self.ground_truths[filename])
+
+    def get_query(self, filename: str, get_also_users: bool = False) -> Dict[int, str]:
+        """
+        Query dictionary of the project with file stem filename, splitting it on first use.
+        """
+        key = (filename, get_also_users)
+        if key not in self.queries:
+            self.write_ground_truths(self._split(filename, get_also_users))
+        return dict(self.queries[key])
+
+    def get_ground_truth(self, filename: str) -> List[Tuple[int, str]]:
+        if (filename, False) not in self.queries and filename not in self.ground_truths:
+            self.get_query(filename)
+        return list(self.ground_truths.get(filename, []))
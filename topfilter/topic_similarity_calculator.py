@@ -3,19 +3,33 @@ import math
 import logging
 from pathlib import Path
 from collections import defaultdict, OrderedDict
-from typing import Dict, List, Set, Tuple, Optional, Any, Union
+from typing import Dict, Iterable, List, Set, Tuple, Optional, Any, Union
 import heapq
 import csv
+import numpy as np
 from data_reader import DataReader
-from graph import Graph
+from document_frequency import DocumentFrequency
+from library_index import LibraryIndex
+from corpus_store import CorpusStore
+from sparse_matrix import SparseMatrix
+from ranking import rank_indices, rank_scores
+from sharding import imap_sharded
+from split_manager import SplitManager
+from similarity_store import SimilarityStore, SimilarityStoreWriter
+from pipeline import FoldData
 
 class TopicSimilarityCalculator:
     def __init__(self, source_dir: str, sub_folder: str, tr_start_pos1: int, tr_end_pos1: int,
-                 tr_start_pos2: int, tr_end_pos2: int, te_start_pos: int, te_end_pos: int, bayesian: bool):
+                 tr_start_pos2: int, tr_end_pos2: int, te_start_pos: int, te_end_pos: int, bayesian: bool,
+                 store: Optional[CorpusStore] = None, batched: bool = False,
+                 top_k: Optional[int] = None, splits: Optional[SplitManager] = None,
+                 binary_store: bool = False, fold_data: Optional[FoldData] = None, persist: bool = True,
+                 num_of_neighbours: Optional[int] = None):
         self.src_dir = source_dir
         self.sub_folder = sub_folder
         self.ground_truth = os.path.join(self.src_dir, self.sub_folder, "GroundTruth")
         self.sim_dir = os.path.join(self.src_dir, self.sub_folder, "Similarities")
+        self.similarity_file = os.path.join(self.src_dir, self.sub_folder, SimilarityStore.FILENAME)
         self.training_start_pos1 = tr_start_pos1
         self.training_end_pos1 = tr_end_pos1
         self.training_start_pos2 = tr_start_pos2
@@ -23,129 +37,294 @@ class TopicSimilarityCalculator:
         self.testing_start_pos = te_start_pos
         self.testing_end_pos = te_end_pos
         self.bayesian = bayesian
+        self.batched = batched
+        self.top_k = top_k
+        self.binary_store = binary_store
+        self.fold_data = fold_data
+        self.persist = persist
+        # Neighbours of each testing project kept in fold_data, all of them when None
+        self.num_of_neighbours = num_of_neighbours
         self.num_of_EASE_input = 5
+        self.store = store or CorpusStore.for_dataset(source_dir)
+        self.splits = splits or SplitManager(source_dir, sub_folder, bayesian, self.num_of_EASE_input)
         self.logger = logging.getLogger(__name__)
 
-    def compute_weight_cosine_similarity(self):
-        reader = DataReader(self.src_dir)
+    def read_projects(self, reader: DataReader) -> Tuple[Dict[int, str], Dict[int, str]]:
         training_projects = {}
-        
+
         if self.training_start_pos1 < self.training_end_pos1:
             projects_file = os.path.join(self.src_dir, "projects.txt")
             training_projects = reader.read_project_list(
                 projects_file, self.training_start_pos1, self.training_end_pos1)
-        
+
         if self.training_start_pos2 < self.training_end_pos2:
             projects_file = os.path.join(self.src_dir, "projects.txt")
             temp_projects = reader.read_project_list(
                 projects_file, self.training_start_pos2, self.training_end_pos2)
             training_projects.update(temp_projects)
-        
+
         projects_file = os.path.join(self.src_dir, "projects.txt")
         testing_projects = reader.read_project_list(
             projects_file, self.testing_start_pos, self.testing_end_pos)
-        
-        graph = None
-        
-        all_training_libs = set()
-        training_dictionaries = {}
-        
+        return training_projects, testing_projects
+
+    def build_training_df(self, training_projects: Dict[int, str], testing_projects: Dict[int, str]) -> DocumentFrequency:
+        # Training DF = dataset DF minus the held-out fold
+        training_filenames = [pro.replace("git://github.com/", "").replace("/", "__") for pro in training_projects.values()]
+        testing_filenames = [pro.replace("git://github.com/", "").replace("/", "__") for pro in testing_projects.values()]
+        dataset_df = DocumentFrequency.for_dataset(self.store, training_filenames + testing_filenames)
+        return dataset_df.subtract(self.store, testing_filenames)
+
+    def extract_testing_dictionary(self, filename: str) -> Dict[int, str]:
+        return self.splits.get_query(filename)
+
+    def compute_weight_cosine_similarity(self, workers: int = 1):
+        """
+        With workers > 1 the testing projects of the fold are split into chunks
+        processed by forked workers sharing the read-only training structures.
+        With binary_store the ranked neighbours are written to the fold's binary
+        similarity store instead of the Similarities/ TSV files; with fold_data the
+        top num_of_neighbours of them are also kept in memory, and persist=False
+        skips the TSV files altogether.
+        """
+        reader = DataReader(self.src_dir)
+        training_projects, testing_projects = self.read_projects(reader)
+        self.splits.prepare(testing_projects.values())
+
+        if self.batched:
+            self.compute_batched_weight_cosine_similarity(reader, training_projects, testing_projects)
+            return
+
+        library_index = LibraryIndex()
+
         for key_training, training_pro in training_projects.items():
             training_filename = training_pro.replace("git://github.com/", "").replace("/", "__")
-            training_graph_file = os.path.join(self.src_dir, f"graph_{training_filename}")
-            training_dict_file = os.path.join(self.src_dir, f"dicth_{training_filename}")
-            
-            training_libs = reader.get_libraries(training_dict_file)
-            all_training_libs.update(training_libs)
-            
-            training_dict = reader.read_dictionary(training_dict_file)
-            training_dictionaries[key_training] = training_dict
-            training_graph = Graph(training_graph_file, training_dict)
-            
-            if graph is None:
-                graph = Graph()
-                graph.OutLinks = training_graph.OutLinks.copy()
-                graph.dictionary = training_graph.dictionary.copy()
-                graph.nodeCount = training_graph.nodeCount
-            else:
-                graph.combine(training_graph, training_dict)
-        
-        get_also_users = False
-        
-        for key_testing, testing_pro in testing_projects.items():
-            try:
-                all_libs = set(all_training_libs)
-                combined_graph = Graph()
-                combined_graph.OutLinks = graph.OutLinks.copy()
-                combined_graph.dictionary = graph.dictionary.copy()
-                combined_graph.nodeCount = graph.nodeCount
-                
-                sim = {}
-                filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
-                testing_graph_file = os.path.join(self.src_dir, f"graph_{filename}")
-                testing_dict_file = os.path.join(self.src_dir, f"dicth_{filename}")
-                
-                testing_dict = (reader.extract_EASE_dictionary(testing_dict_file, self.num_of_EASE_input, self.ground_truth) 
-                              if self.bayesian 
-                              else reader.extract_half_dictionary(testing_dict_file, self.ground_truth, get_also_users))
-                
-                testing_libs = {v for v in testing_dict.values() if v.startswith("#DEP#")}
-                all_libs.update(testing_libs)
-                
-                testing_graph = Graph(testing_graph_file, testing_dict)
-                combined_graph.combine(testing_graph, testing_dict)
-                
-                lib_weight = {}
-                graph_edges = combined_graph.get_out_links()
-                
-                for start_node, outlinks in graph_edges.items():
-                    for end_node in outlinks:
-                        lib_weight[end_node] = lib_weight.get(end_node, 0) + 1
-                
-                number_of_projects = len(graph_edges)
-                for lib_id, freq in lib_weight.items():
-                    weight = number_of_projects / freq
-                    idf = math.log(weight)
-                    lib_weight[lib_id] = idf
-                
-                for key_training, training_pro in training_projects.items():
-                    training_filename = training_pro.replace("git://github.com/", "").replace("/", "__")
-                    training_dict_file = os.path.join(self.src_dir, f"dicth_{training_filename}")
-                    training_libs = reader.get_libraries(training_dict_file)
-                    
-                    union = testing_libs.union(training_libs)
-                    lib_set = list(union)
-                    
-                    if len(union) != len(lib_set):
-                        self.logger.info("Something went wrong!")
-                    
-                    vector1 = [0.0] * len(lib_set)
-                    vector2 = [0.0] * len(lib_set)
-                    
-                    for i, lib in enumerate(lib_set):
-                        if lib in testing_libs:
-                            try:
-                                lib_id = combined_graph.dictionary[lib]
-                                vector1[i] = lib_weight.get(lib_id, 0.0)
-                            except KeyError:
-                                self.logger.error(lib)
-                        
-                        if lib in training_libs:
-                            lib_id = combined_graph.dictionary[lib]
-                            vector2[i] = lib_weight.get(lib_id, 0.0)
-                    
-                    val = self.cosine_similarity(vector1, vector2)
-                    sim[str(key_training)] = val
-                
-                sorted_sim = sorted(sim.items(), key=lambda x: x[1], reverse=True)
+            library_index.add(key_training, self.store.get_libraries(training_filename))
+
+        training_df = self.build_training_df(training_projects, testing_projects)
+
+        def task(testing: Tuple[int, str]):
+            return self.compute_testing_similarity(reader, testing[0], testing[1], training_projects,
+                                                   library_index, training_df)
+
+        results = imap_sharded(task, list(testing_projects.items()), workers)
+        self.store_similarities((result for result in results if result is not None),
+                                training_projects, testing_projects)
+
+    def collects_similarities(self) -> bool:
+        return self.binary_store or self.fold_data is not None
+
+    def writes_tsv(self) -> bool:
+        return self.persist and not self.binary_store
+
+    def collected_size(self) -> Optional[int]:
+        """
+        Length of the rankings handed back for storing: the binary store keeps
+        whole rankings, the fold data only the neighbours it serves.
+        """
+        return None if self.binary_store else self.num_of_neighbours
+
+    def store_similarities(self, rows: Iterable[Tuple[int, np.ndarray, np.ndarray]], training_projects: Dict[int, str],
+                           testing_projects: Dict[int, str]):
+        """
+        Hand the (testing id, ranked training ids, similarities) of the testing
+        projects to the binary similarity store and to the in-memory fold data,
+        one testing project at a time as rows yields them.
+        """
+        writer = SimilarityStoreWriter(self.similarity_file, testing_projects) if self.binary_store else None
+        size = self.num_of_neighbours
+        try:
+            for key, neighbours, scores in rows:
+                if writer is not None:
+                    writer.add(key, neighbours, scores)
+                if self.fold_data is not None:
+                    self.fold_data.set_similarities(testing_projects[key], [
+                        (training_projects[n], score) for n, score in zip(neighbours[:size].tolist(), scores[:size].tolist())])
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def compute_testing_similarity(self, reader: DataReader, key_testing: int, testing_pro: str,
+                                   training_projects: Dict[int, str], library_index: LibraryIndex,
+                                   training_df: DocumentFrequency) -> Optional[Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        Rank the training projects for one testing project and write them as TSV;
+        the ranking is returned as (testing id, training ids, similarities), cut to
+        collected_size, when the binary store or the in-memory fold data collects it.
+        """
+        try:
+            sim = dict.fromkeys((str(key) for key in training_projects), 0.0)
+            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+            testing_dict = self.extract_testing_dictionary(filename)
+
+            testing_libs = {v for v in testing_dict.values() if v.startswith("#DEP#")}
+
+            # The testing project only shifts the DF of its own topics
+            testing_graph = self.store.get_graph(filename, testing_dict)
+            delta_df = DocumentFrequency.from_graph(testing_graph, testing_dict)
+            lib_weight = {}
+
+            # Training projects sharing no topic with the testing project keep similarity 0
+            candidates = library_index.candidates(testing_libs)
+            for key_training in training_projects:
+                if key_training not in candidates:
+                    continue
+                training_libs = library_index.get_libraries(key_training)
+
+                union = testing_libs.union(training_libs)
+                lib_set = list(union)
+
+                if len(union) != len(lib_set):
+                    self.logger.info("Something went wrong!")
+
+                vector1 = [0.0] * len(lib_set)
+                vector2 = [0.0] * len(lib_set)
+
+                for i, lib in enumerate(lib_set):
+                    weight = lib_weight.get(lib)
+                    if weight is None:
+                        weight = training_df.idf(lib, delta_df)
+                        lib_weight[lib] = weight
+
+                    if lib in testing_libs:
+                        vector1[i] = weight
+
+                    if lib in training_libs:
+                        vector2[i] = weight
+
+                val = self.cosine_similarity(vector1, vector2)
+                sim[str(key_training)] = val
+
+            sorted_sim = rank_scores(sim, self.top_k)
+            if self.writes_tsv():
                 output_file = os.path.join(self.sim_dir, filename)
-                
                 with open(output_file, 'w') as writer:
                     for key, score in sorted_sim:
                         content = f"{testing_pro}\t{training_projects[int(key)]}\t{score}"
                         writer.write(content + "\n")
-            except IOError as e:
-                self.logger.error(f"Error processing testing project {testing_pro}: {e}")
+            if self.collects_similarities():
+                ranked = sorted_sim[:self.collected_size()]
+                return (key_testing, np.array([int(key) for key, _ in ranked], dtype=np.int32),
+                        np.array([score for _, score in ranked], dtype=np.float64))
+        except IOError as e:
+            self.logger.error(f"Error processing testing project {testing_pro}: {e}")
+        return None
+
+    def compute_batched_weight_cosine_similarity(self, reader: DataReader, training_projects: Dict[int, str],
+                                                 testing_projects: Dict[int, str]):
+        """
+        Compute every testing x training similarity of the fold with sparse matrix products.
+
+        A testing project t sees the IDF w_t(l) = log(n_t / (df(l) + delta_t(l))). Only its own
+        topics differ from the base weight b_t(l) = log(n_t / df(l)), so with R the binary
+        training x topic matrix:
+            dot(t, r)    = (Q @ R.T)[t, r]                        Q[t, l] = w_t(l)^2, l in t
+            |r|^2 for t  = (R @ b_t^2)[r] + (C @ R.T)[t, r]       C[t, l] = w_t(l)^2 - b_t(l)^2
+        which gives the same scores as the per-pair computation.
+        """
+        training_keys = list(training_projects.keys())
+        training_df = self.build_training_df(training_projects, testing_projects)
+        vocabulary: Dict[str, int] = {}
+
+        def column(lib: str) -> int:
+            col = vocabulary.get(lib)
+            if col is None:
+                col = len(vocabulary)
+                vocabulary[lib] = col
+            return col
+
+        rows, cols = [], []
+        for row, key_training in enumerate(training_keys):
+            training_filename = training_projects[key_training].replace("git://github.com/", "").replace("/", "__")
+            for lib in self.store.get_libraries(training_filename):
+                rows.append(row)
+                cols.append(column(lib))
+
+        testing_rows = []
+        q_rows, q_cols, q_vals = [], [], []
+        c_rows, c_cols, c_vals = [], [], []
+        testing_norms = []
+        testing_num_projects = []
+        for key_testing, testing_pro in testing_projects.items():
+            filename = testing_pro.replace("git://github.com/", "").replace("/", "__")
+            testing_dict = self.extract_testing_dictionary(filename)
+            testing_libs = {v for v in testing_dict.values() if v.startswith("#DEP#")}
+            testing_graph = self.store.get_graph(filename, testing_dict)
+            delta_df = DocumentFrequency.from_graph(testing_graph, testing_dict)
+
+            row = len(testing_rows)
+            testing_rows.append((key_testing, testing_pro, filename))
+            num_projects = training_df.num_projects + delta_df.num_projects
+            testing_num_projects.append(num_projects)
+
+            norm = 0.0
+            for lib in testing_libs:
+                weight = training_df.idf(lib, delta_df) ** 2
+                norm += weight
+                q_rows.append(row)
+                q_cols.append(column(lib))
+                q_vals.append(weight)
+            testing_norms.append(math.sqrt(norm))
+
+            for lib in delta_df.df:
+                freq = training_df.df.get(lib, 0)
+                base = math.log(num_projects / freq) ** 2 if freq > 0 else 0.0
+                c_rows.append(row)
+                c_cols.append(column(lib))
+                c_vals.append(training_df.idf(lib, delta_df) ** 2 - base)
+
+        shape_training = (len(training_keys), len(vocabulary))
+        shape_testing = (len(testing_rows), len(vocabulary))
+        training_matrix = SparseMatrix.from_triplets(rows, cols, np.ones(len(rows)), shape_training)
+        training_t = training_matrix.transpose()
+        dots = SparseMatrix.from_triplets(q_rows, q_cols, q_vals, shape_testing).times_matrix(training_t).to_scipy()
+        corrections = SparseMatrix.from_triplets(c_rows, c_cols, c_vals, shape_testing).times_matrix(training_t).to_scipy()
+
+        # Base squared norm of each training row, for each distinct project count seen by the testing projects
+        df = np.zeros(len(vocabulary))
+        for lib, col in vocabulary.items():
+            df[col] = training_df.df.get(lib, 0)
+        base_norms = {}
+        for num_projects in set(testing_num_projects):
+            weights = np.zeros(len(vocabulary))
+            mask = df > 0
+            weights[mask] = np.log(num_projects / df[mask]) ** 2
+            base_norms[num_projects] = training_matrix.times(weights)
+
+        keys = np.array(training_keys, dtype=np.int32)
+
+        def ranked_rows():
+            # One testing project at a time, so only the sparse products are held for the fold
+            for row, (key_testing, testing_pro, filename) in enumerate(testing_rows):
+                try:
+                    scores = np.zeros(len(training_keys))
+                    start, end = dots.indptr[row], dots.indptr[row + 1]
+                    cols_t = dots.indices[start:end]
+                    dot = dots.data[start:end]
+                    correction = np.zeros(len(training_keys))
+                    c_start, c_end = corrections.indptr[row], corrections.indptr[row + 1]
+                    correction[corrections.indices[c_start:c_end]] = corrections.data[c_start:c_end]
+                    training_norm2 = base_norms[testing_num_projects[row]][cols_t] + correction[cols_t]
+                    denominator = testing_norms[row] * np.sqrt(np.maximum(training_norm2, 0.0))
+                    valid = denominator > 0
+                    scores[cols_t[valid]] = dot[valid] / np.sqrt(denominator[valid])
+
+                    # Ties keep training order, as in the per-pair path
+                    order = rank_indices(scores, self.top_k)
+                    if self.writes_tsv():
+                        output_file = os.path.join(self.sim_dir, filename)
+                        with open(output_file, 'w') as writer:
+                            for i in order:
+                                content = f"{testing_pro}\t{training_projects[training_keys[i]]}\t{scores[i]}"
+                                writer.write(content + "\n")
+                except IOError as e:
+                    self.logger.error(f"Error processing testing project {testing_pro}: {e}")
+                    continue
+                if self.collects_similarities():
+                    collected = order[:self.collected_size()]
+                    yield key_testing, keys[collected], scores[collected]
+
+        self.store_similarities(ranked_rows(), training_projects, testing_projects)
 
     def cosine_similarity(self, vector1: List[float], vector2: List[float]) -> float:
         sclar = sum(v1 * v2 for v1, v2 in zip(vector1, vector2))
@@ -0,0 +1,81 @@
+from typing import Dict, Iterable, List
+import numpy as np
+from bitset import co_occurrence, popcount
+
+
+class UserItemMatrix:
+    """
+    Neighbourhood of a testing project: which libraries its k most similar
+    projects use, stored as one packed bitset per library column, and which
+    libraries of the testing project are known. build orders the columns by
+    corpus store library id; reorder takes them in any other order.
+    """
+    __slots__ = ("library_ids", "neighbours", "known", "num_neighbours")
+
+    def __init__(self, library_ids: np.ndarray, neighbours: np.ndarray, known: np.ndarray, num_neighbours: int):
+        self.library_ids = library_ids
+        # (ceil(k / 8), N) uint8, bit l of column j set when neighbour l uses library j
+        self.neighbours = neighbours
+        # (N,) bool, True for the libraries of the testing project
+        self.known = known
+        self.num_neighbours = num_neighbours
+
+    @classmethod
+    def build(cls, neighbour_ids: Dict[int, Iterable[int]], testing_ids: Iterable[int],
+              num_neighbours: int) -> 'UserItemMatrix':
+        """
+        Build the matrix from the library ids of the neighbours, keyed by row
+        (0 for the most similar), and of the testing project.
+        """
+        rows: List[int] = []
+        ids: List[int] = []
+        for row, lib_ids in neighbour_ids.items():
+            lib_ids = list(lib_ids)
+            rows.extend([row] * len(lib_ids))
+            ids.extend(lib_ids)
+        testing_ids = np.fromiter(testing_ids, dtype=np.int32)
+        ids = np.asarray(ids, dtype=np.int32)
+        rows = np.asarray(rows, dtype=np.int64)
+
+        library_ids = np.union1d(ids, testing_ids).astype(np.int32)
+        cols = np.searchsorted(library_ids, ids)
+
+        neighbours = np.zeros(((num_neighbours + 7) // 8, len(library_ids)), dtype=np.uint8)
+        np.bitwise_or.at(neighbours, (rows // 8, cols), (0x80 >> (rows % 8)).astype(np.uint8))
+        known = np.zeros(len(library_ids), dtype=bool)
+        known[np.searchsorted(library_ids, testing_ids)] = True
+        return cls(library_ids, neighbours, known, num_neighbours)
+
+    def reorder(self, order: np.ndarray) -> 'UserItemMatrix':
+        """
+        Matrix with column j taken from column order[j].
+        """
+        return UserItemMatrix(self.library_ids[order], self.neighbours[:, order], self.known[order],
+                              self.num_neighbours)
+
+    def num_libraries(self) -> int:
+        return len(self.library_ids)
+
+    def known_columns(self) -> np.ndarray:
+        return np.flatnonzero(self.known)
+
+    def unknown_columns(self) -> np.ndarray:
+        return np.flatnonzero(~self.known)
+
+    def unpack(self) -> np.ndarray:
+        """
+        Dense (k, N) 0/1 uint8 view of the neighbour rows.
+        """
+        return np.unpackbits(self.neighbours, axis=0, count=self.num_neighbours)
+
+    def column_counts(self) -> np.ndarray:
+        """
+        Number of neighbours using each library.
+        """
+        return popcount(self.neighbours)
+
+    def co_occurrence(self, cols1: np.ndarray, cols2: np.ndarray) -> np.ndarray:
+        """
+        counts[a, b] = number of neighbours using both library cols1[a] and library cols2[b].
+        """
+        return co_occurrence(self.neighbours[:, cols1], self.neighbours[:, cols2])
@@ -1,8 +1,30 @@
 import logging
 from pathlib import Path
-from typing import Dict, Set
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
 from data_reader import DataReader
 from metrics import Metrics
+from evaluation_engine import EvaluationEngine
+from pipeline import fold_step
+
+
+def evaluate_fold(src_dir: str, bayesian: bool, i: int, step: int, num_of_projects: int,
+                  project_files: bool = False) -> Dict[str, Any]:
+    """
+    Evaluate fold i without writing Results; return its status, tables, scores and recall rate.
+    """
+    validator = Validator(src_dir, bayesian)
+    validator.project_files = project_files
+    result = {"fold": i, "status": "ok"}
+    try:
+        result["tables"], result["vals"], result["recall_rate"] = validator.evaluate(
+            validator.fold_metrics(i, step, num_of_projects))
+    except Exception as e:
+        validator.logger.error(f"Error evaluating fold {i}: {e}")
+        result["status"] = f"failed: {e}"
+    return result
+
 
 class Validator:
     """
@@ -15,10 +37,12 @@ class Validator:
         self.bayesian = bayesian
         self.num_of_libraries = 20
         self.num_of_EASE_input = 5
+        # Also write the per-project SuccesRate/, PrecisionRecall/ files of the evaluation
+        self.project_files = False
         self.logger = logging.getLogger(__name__)
         self.input_file = "projects.txt"
 
-    def run(self):
+    def run(self, workers: int = 1, folds: Optional[List[int]] = None):
         """
         Run the 10-fold cross validation and compute all evaluation metrics.
         """
@@ -26,70 +50,124 @@ class Validator:
         reader = DataReader(self.src_dir)
         projects_file = Path(self.src_dir) / self.input_file
         num_of_projects = reader.get_number_of_projects(str(projects_file))
-        self.compute_evaluation_metrics(num_of_projects)
+        self.compute_evaluation_metrics(num_of_projects, workers, folds)
 
-    def compute_evaluation_metrics(self, num_of_projects: int):
+    def compute_evaluation_metrics(self, num_of_projects: int, workers: int = 1,
+                                   folds: Optional[List[int]] = None):
         """
-        Compute various evaluation metrics for the recommendation system.
+        Evaluate the given folds, by default those whose testing projects all
+        have a recommendation file, on a process pool of the given number of
+        workers if more than one, and write the Results of those evaluated
+        successfully once all of them are done.
         """
-        step = num_of_projects // 10
-        cut_off_value = self.num_of_libraries
-        recall_rate = 0.0
+        step = fold_step(num_of_projects)
+        if folds is None:
+            folds = []
+            for i in range(10):
+                if self.has_recommendations(i, step, num_of_projects):
+                    folds.append(i)
+                else:
+                    self.logger.info(f"Skipping fold {i}: no recommendations")
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(evaluate_fold, self.src_dir, self.bayesian, i, step, num_of_projects,
+                                           self.project_files)
+                           for i in folds]
+                results = [future.result() for future in as_completed(futures)]
+        else:
+            results = [evaluate_fold(self.src_dir, self.bayesian, i, step, num_of_projects, self.project_files)
+                       for i in folds]
+        for result in sorted(results, key=lambda r: r["fold"]):
+            if result["status"] != "ok":
+                self.logger.info(f"Skipping fold {result['fold']}: {result['status']}")
+        self.merge_results([result for result in results if result["status"] == "ok"])
+
+    def has_recommendations(self, i: int, step: int, num_of_projects: int) -> bool:
+        """
+        Whether every testing project of fold i has a file in RoundN/Recommendations.
+        """
+        reader = DataReader(self.src_dir)
+        projects_file = str(Path(self.src_dir) / self.input_file)
+        testing_projects = reader.read_project_list(projects_file, 1 + i * step, min((i + 1) * step, num_of_projects))
+        rec_dir = Path(self.src_dir) / f"Round{i + 1}" / "Recommendations"
+        return bool(testing_projects) and all(
+            (rec_dir / pro.replace("git://github.com/", "").replace("/", "__")).is_file()
+            for pro in testing_projects.values())
+
+    def fold_metrics(self, i: int, step: int, num_of_projects: int) -> Metrics:
+        training_start_pos1 = 1
+        training_end_pos1 = i * step
+        training_start_pos2 = (i + 1) * step + 1
+        training_end_pos2 = num_of_projects
+        testing_start_pos = 1 + i * step
+        testing_end_pos = (i + 1) * step
+        k = i + 1
+        sub_folder = f"Round{k}"
+
+        return Metrics(
+            k, self.num_of_libraries, self.src_dir, sub_folder,
+            training_start_pos1, training_end_pos1,
+            training_start_pos2, training_end_pos2,
+            testing_start_pos, testing_end_pos
+        )
+
+    def evaluate(self, metrics: Metrics) -> Tuple[Dict[str, List[List[Any]]], Dict[str, float], float]:
+        """
+        Compute the evaluation metrics of one fold; return its result tables,
+        the scores collected for the Results file and the fold's recall rate.
+        """
+        engine = EvaluationEngine(metrics, self.bayesian, self.num_of_EASE_input, self.project_files)
+        return engine.evaluate(self.num_of_libraries)
+
+    def merge_results(self, results: List[Dict[str, Any]], name: str = "EPC"):
+        """
+        Write the Results of the evaluated folds: the tables of every fold, their
+        mean and variance across the folds and the collected scores.
+        """
+        results = sorted(results, key=lambda r: r["fold"])
+        res_dir = Path(self.src_dir) / "Results"
+        res_dir.mkdir(exist_ok=True)
         vals = {}
-        name = "EPC"
-
-        for i in range(10):
-            training_start_pos1 = 1
-            training_end_pos1 = i * step
-            training_start_pos2 = (i + 1) * step + 1
-            training_end_pos2 = num_of_projects
-            testing_start_pos = 1 + i * step
-            testing_end_pos = (i + 1) * step
-            k = i + 1
-            sub_folder = f"Round{k}"
-
-            metrics = Metrics(
-                k, self.num_of_libraries, self.src_dir, sub_folder,
-                training_start_pos1, training_end_pos1,
-                training_start_pos2, training_end_pos2,
-                testing_start_pos, testing_end_pos
-            )
-
-            # self.logger.info("==============Long tail==============")
-            # metrics.long_tail()
-
-            if self.bayesian:
-                metrics.catalog_coverage_b()
-                metrics.success_rate_b(self.num_of_EASE_input)
-                metrics.compute_average_success_rate_b()
-                metrics.precision_recall_b(self.num_of_EASE_input)
-                metrics.compute_average_precision_recall_b()
-
-            # Compute standard metrics
-            metrics.success_rate()
-            metrics.success_rate_n()
-            metrics.precision_recall()
-            recall_rate += metrics.recall_rate()
-            
-            metrics.compute_average_precision_recall()
-            metrics.compute_average_success_rate_n()
-            metrics.compute_average_success_rate()
-            metrics.catalog_coverage()
-            metrics.entropy_analysis()
-            metrics.epc_analysis()
-            metrics.ndcg_analysis()
-
-            # Collect results
-            vals.update(metrics.get_some_scores(cut_off_value, "EPC"))
-            vals.update(metrics.get_some_scores(cut_off_value, "Entropy"))
-            vals.update(metrics.get_some_scores(cut_off_value, "Entropy"))  # Duplicate in original?
-            break
-
-        # Write results to file
+        for result in results:
+            EvaluationEngine.write_tables(str(res_dir), result["fold"] + 1, result["tables"])
+            vals.update(result["vals"])
+
+        for table, rows in self.merge_tables([result["tables"] for result in results]).items():
+            try:
+                with open(res_dir / table, 'w') as writer:
+                    writer.write("".join("\t".join(f"{value}" for value in row) + "\n" for row in rows))
+            except IOError as e:
+                self.logger.error(e)
+        self.write_results(vals, name)
+
+    @staticmethod
+    def merge_tables(fold_tables: List[Dict[str, List[List[Any]]]]) -> Dict[str, List[List[Any]]]:
+        """
+        {name}_Mean and {name}_Variance of every result table: the mean and
+        population variance of each value over the folds having that row.
+        """
+        merged = {}
+        names = [name for tables in fold_tables for name in tables]
+        for name in dict.fromkeys(names):
+            keyed = name in EvaluationEngine.KEYED_TABLES
+            folds = [tables[name] for tables in fold_tables if name in tables]
+            means, variances = [], []
+            for row in range(max(len(rows) for rows in folds)):
+                fold_rows = [rows[row] for rows in folds if row < len(rows)]
+                values = np.array([fold_row[1:] if keyed else fold_row for fold_row in fold_rows], dtype=np.float64)
+                key = fold_rows[0][:1] if keyed else []
+                means.append(key + values.mean(axis=0).tolist())
+                variances.append(key + values.var(axis=0).tolist())
+            merged[f"{name}_Mean"] = means
+            merged[f"{name}_Variance"] = variances
+        return merged
+
+    def write_results(self, vals: Dict[str, float], name: str = "EPC"):
         res_dir = Path(self.src_dir) / "Results"
         res_dir.mkdir(exist_ok=True)
-        output_file = res_dir / f"{name}@{cut_off_value}"
+        output_file = res_dir / f"{name}@{self.num_of_libraries}"
 
         with open(output_file, 'w') as writer:
             for score in vals.values():
-                writer.write(f"{score}\n")
\ No newline at end of file
+                writer.write(f"{score}\n")